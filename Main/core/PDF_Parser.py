@@ -3,10 +3,15 @@ import os
 
 import requests
 
+# base url of the OCR service, can be pointed at a local stand-in
+OCR_API_URL = os.environ.get("OCR_API_URL", "https://api.doxter.ai/")
+# seconds a single request to the OCR service may take, so a hung call cannot block forever
+OCR_REQUEST_TIMEOUT = float(os.environ.get("OCR_REQUEST_TIMEOUT", 30))
+
 
 def parse_img(name, byte_img):
     # Define the URL and endpoint of the API you want to connect to
-    api_url = "https://api.doxter.ai/"
+    api_url = OCR_API_URL
     endpoint = "analyzer/run/"
 
     # Define the necessary headers and authentication for the request
@@ -17,7 +22,9 @@ def parse_img(name, byte_img):
     file = {"image": (name, byte_img, "image/jpeg")}
     data = {"project": 1063, "run_document_detector": True, "run_table_detector": False, "rtl": True}
     # Send a POST request to create a new customer
-    response = requests.post(api_url + endpoint, headers=headers, data=data, files=file)
+    response = requests.post(
+        api_url + endpoint, headers=headers, data=data, files=file, timeout=OCR_REQUEST_TIMEOUT
+    )
 
     # Check the response status code to ensure your request was successful
     if not response.ok:
@@ -28,7 +35,7 @@ def parse_img(name, byte_img):
 
 def fetch_text(uuid):
     # Define the URL and endpoint of the API you want to connect to
-    api_url = "https://api.doxter.ai/"
+    api_url = OCR_API_URL
     endpoint = f"analyzer/result/{uuid}"
 
     # Define the necessary headers and authentication for the request
@@ -37,7 +44,7 @@ def fetch_text(uuid):
     }
 
     # Send a POST request to create a new customer
-    response = requests.get(api_url + endpoint, headers=headers)
+    response = requests.get(api_url + endpoint, headers=headers, timeout=OCR_REQUEST_TIMEOUT)
 
     # Check the response status code to ensure your request was successful
     if not response.ok:
@@ -0,0 +1,111 @@
+import heapq
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Tuple
+
+# BM25 term frequency saturation and length normalization
+K1 = 1.5
+B = 0.75
+# constant of reciprocal rank fusion, higher values flatten the ranks
+RRF_K = 60
+# queries of at most this many terms that are not questions are keyword queries
+KEYWORD_MAX_TERMS = 4
+# keyword queries are answered by BM25 alone when the best match holds every term,
+# or scores this share of an average length document holding every term once
+LEXICAL_MIN_SCORE = 0.75
+
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the "
+    "to was were what when where which who why will with how do does did".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased words of a text without stop words, numbers and tickers are kept"""
+    return [word for word in re.findall(r"\w+", text.lower()) if word not in STOP_WORDS]
+
+
+def is_keyword_query(query: str) -> bool:
+    """Whether a query is a few exact terms rather than a question,
+    e.g. a ticker, a product name or "EBITDA 2022"
+    """
+    terms = tokenize(query)
+    return 0 < len(terms) <= KEYWORD_MAX_TERMS and not query.strip().endswith("?")
+
+
+class BM25Index:
+    """In-memory inverted index ranking documents with Okapi BM25"""
+
+    def __init__(self):
+        # term -> document id -> term frequency
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.lengths: Dict[str, int] = {}
+        self.total_length = 0
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def add(self, doc_id: str, text: str) -> None:
+        terms = tokenize(text)
+        for term, frequency in Counter(terms).items():
+            self.postings.setdefault(term, {})[doc_id] = frequency
+        self.lengths[doc_id] = len(terms)
+        self.total_length += len(terms)
+
+    def remove(self, doc_id: str, text: str) -> None:
+        """Removes a document, text is needed to find its postings"""
+        if doc_id not in self.lengths:
+            return
+        for term in set(tokenize(text)):
+            postings = self.postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(doc_id, None)
+            if not postings:
+                del self.postings[term]
+        self.total_length -= self.lengths.pop(doc_id)
+
+    def _idf(self, term: str) -> float:
+        """Inverse document frequency, highest for terms no document holds"""
+        matches = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.lengths) - matches + 0.5) / (matches + 0.5))
+
+    def is_confident(self, query: str, hits: List[Tuple[str, float]]) -> bool:
+        """Whether the hits of a keyword query are good enough to skip dense search:
+        the best one holds every term of the query or scores LEXICAL_MIN_SCORE
+        of an average length document holding each term once, the sum of their idf
+        """
+        if not hits or not is_keyword_query(query):
+            return False
+        terms = set(tokenize(query))
+        best_id, best_score = hits[0]
+        if all(best_id in self.postings.get(term, ()) for term in terms):
+            return True
+        return best_score >= LEXICAL_MIN_SCORE * sum(self._idf(term) for term in terms)
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[str, float]]:
+        """Returns the ids and scores of the k best matching documents"""
+        if not self.lengths:
+            return []
+        count = len(self.lengths)
+        average_length = self.total_length / count or 1
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf(term)
+            for doc_id, frequency in postings.items():
+                norm = K1 * (1 - B + B * self.lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (K1 + 1) / (frequency + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+def fuse_rankings(rankings: List[List[str]], k: int = 4) -> List[str]:
+    """Merges rankings of document ids with reciprocal rank fusion"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1 / (RRF_K + rank + 1)
+    return heapq.nlargest(k, scores, key=scores.__getitem__)
@@ -0,0 +1,81 @@
+import re
+from typing import Dict, List, Optional
+
+from langchain.docstore.document import Document
+
+from Main.core.ocr import IMG_DATA_END, IMG_DATA_START
+
+# documents with fewer pages are left untouched
+MIN_PAGES = 4
+# a line is boilerplate when it occurs on at least this share of the pages
+MIN_PAGE_SHARE = 0.5
+# longer lines are body text even when repeated
+MAX_LINE_CHARS = 200
+# boilerplate is learned from the first pages only so streamed files can strip it early
+SAMPLE_PAGES = 32
+
+LETTER = re.compile(r"[^\W\d_]")
+# "Page 3", "Page 3 of 9" and "3 of 9", the only numbers that differ between repeats
+PAGE_NUMBER = re.compile(r"\b(?:page\s+)?\d+\s+of\s+\d+\b|\bpage\s+\d+\b", re.IGNORECASE)
+# what a line holding nothing but its page number normalizes to
+PAGE_LINE = "#page"
+
+
+def normalize_line(line: str, page: Optional[int] = None) -> str:
+    """Normalizes a line so page numbers and spacing do not hide repeats.
+    Only page number tokens are collapsed, any other figure has to repeat
+    exactly, table rows with the same layout on every page are content.
+    """
+    line = " ".join(line.split())
+    if page is not None and line == str(page):
+        return PAGE_LINE
+    return PAGE_NUMBER.sub(lambda match: re.sub(r"\d+", "#", match.group(0)), line)
+
+
+def find_boilerplate(docs: List[Document]) -> Dict[str, str]:
+    """Finds the header, footer and disclaimer lines repeated across the
+    first SAMPLE_PAGES pages. Lines made only of numbers and punctuation are
+    never boilerplate, a repeated figure is still content, unless the line
+    is the number of its page.
+
+    Returns the normalized lines mapped to their first occurrence.
+    """
+    docs = docs[:SAMPLE_PAGES]
+    if len(docs) < MIN_PAGES:
+        return {}
+
+    counts: Dict[str, int] = {}
+    originals: Dict[str, str] = {}
+    for doc in docs:
+        page = doc.metadata.get("page")
+        seen = set()
+        for line in doc.page_content.split("\n"):
+            line = line.strip()
+            if not line or len(line) > MAX_LINE_CHARS or line in (IMG_DATA_START, IMG_DATA_END):
+                continue
+            normalized = normalize_line(line, page)
+            if normalized != PAGE_LINE and not LETTER.search(line):
+                continue
+            if normalized in seen:
+                continue
+            seen.add(normalized)
+            counts[normalized] = counts.get(normalized, 0) + 1
+            originals.setdefault(normalized, line)
+
+    return {
+        normalized: originals[normalized]
+        for normalized, count in counts.items()
+        if count >= MIN_PAGE_SHARE * len(docs)
+    }
+
+
+def strip_boilerplate(docs: List[Document], boilerplate: Dict[str, str]) -> None:
+    """Removes boilerplate lines from the documents in place"""
+    if not boilerplate:
+        return
+    for doc in docs:
+        lines = [
+            line for line in doc.page_content.split("\n")
+            if normalize_line(line, doc.metadata.get("page")) not in boilerplate
+        ]
+        doc.page_content = "\n".join(lines).strip()
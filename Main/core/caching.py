@@ -24,10 +24,13 @@ def bootstrap_caching():
     ]
     file_hash_funcs: HashFuncsDict = {cls: file_hash_func for cls in file_subtypes}
 
-    parsing.read_file = st.cache_data(show_spinner=False)(parsing.read_file)
+    # parsing.read_file is cached on disk by content hash, see Main.core.parse_cache
     chunking.chunk_file = st.cache_data(show_spinner=False, hash_funcs=file_hash_funcs)(
         chunking.chunk_file
     )
+    chunking.chunk_files = st.cache_data(show_spinner=False, hash_funcs=file_hash_funcs)(
+        chunking.chunk_files
+    )
     embedding.embed_files = st.cache_data(
         show_spinner=False, hash_funcs=file_hash_funcs
     )(embedding.embed_files)
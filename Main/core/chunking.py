@@ -1,38 +1,235 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Iterator, List, Optional, Tuple
+
 from langchain.docstore.document import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from Main.core.parsing import File
+from Main.core.tokenizer import get_encoding
 
+# separators chunks are cut on, in order of preference
+SEPARATORS = [b"\n\n", b"\n", b" "]
+# number of worker processes used by chunk_files and iter_chunk_batches
+CHUNK_WORKERS = int(os.environ.get("CHUNK_WORKERS", os.cpu_count() or 1))
+# below this many characters in total files are chunked in process
+MIN_PARALLEL_CHARS = 500_000
+# large files are split in batches of this many characters across workers
+CHARS_PER_TASK = 200_000
+# bumped when the text or metadata of chunks changes, indexes of older chunks are not reused
+CHUNKER_VERSION = "2"
 
-def chunk_file(
-    file: File, chunk_size: int, chunk_overlap: int = 0, model_name="gpt-3.5-turbo"
-) -> File:
-    """Chunks each document in a file into smaller documents
+
+def _breaks_on(token_bytes: List[bytes], i: int, separator: bytes) -> bool:
+    """Whether a cut between tokens i - 1 and i falls on separator"""
+    return token_bytes[i - 1].endswith(separator) or token_bytes[i].startswith(separator)
+
+
+def _snap_back(token_bytes: List[bytes], low: int, high: int) -> int:
+    """Latest cut in [low, high] on the strongest separator, high if there is none"""
+    for separator in SEPARATORS:
+        for i in range(high, low - 1, -1):
+            if _breaks_on(token_bytes, i, separator):
+                return i
+    return high
+
+
+def _snap_forward(token_bytes: List[bytes], low: int, high: int) -> int:
+    """Earliest cut in [low, high) on a word boundary, low if there is none"""
+    for i in range(low, high):
+        if _breaks_on(token_bytes, i, b"\n") or _breaks_on(token_bytes, i, b" "):
+            return i
+    return low
+
+
+def split_tokens(
+    token_bytes: List[bytes], chunk_size: int, chunk_overlap: int = 0
+) -> List[Tuple[int, int]]:
+    """Cuts a token array into [start, stop) windows of at most chunk_size tokens.
+    Windows end on the strongest separator in their second half and the
+    next window starts chunk_overlap tokens earlier, on a word boundary.
+    """
+    size = len(token_bytes)
+    windows = []
+    start = 0
+    while start < size:
+        stop = min(start + chunk_size, size)
+        if stop < size:
+            stop = _snap_back(token_bytes, start + max(1, chunk_size // 2), stop)
+        windows.append((start, stop))
+        if stop == size:
+            break
+        next_start = max(stop - chunk_overlap, start + 1)
+        if next_start < stop:
+            next_start = _snap_forward(token_bytes, next_start, stop)
+        start = next_start
+    return windows
+
+
+def doc_location(metadata: dict) -> str:
+    """Where a document sits in its file, as cited in answers:
+    the sheet and rows of spreadsheets, the section and table rows of
+    Word documents and the page or slide of everything else
+    """
+    if "sheet" in metadata:
+        location = f"{metadata['sheet']} rows {metadata['rows']}"
+    elif "heading_level" in metadata:
+        location = metadata["section"] or f"p. ~{metadata['approx_page']}"
+        if "table" in metadata:
+            location += f" table {metadata['table']} rows {metadata['rows']}"
+    else:
+        location = str(metadata.get("page", 1))
+    # answers list their sources separated by ", "
+    return " ".join(location.replace(",", " ").split())
+
+
+def chunk_docs(
+    docs: List[Document], chunk_size: int, chunk_overlap: int = 0, model_name="gpt-3.5-turbo"
+) -> List[Document]:
+    """Chunks each document into smaller documents
     according to the specified chunk size and overlap
     where the size is determined by the number of token for the specified model.
+    Each document is encoded once and chunks are cut from its token array,
+    chunks keep the metadata of their document.
     """
 
+    encoding = get_encoding(model_name)
+    all_tokens = encoding.encode_batch(
+        [doc.page_content for doc in docs], disallowed_special=()
+    )
+
     # split each document into chunks
     chunked_docs = []
-    for doc in file.docs:
-        text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-            model_name=model_name,
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-        )
-
-        chunks = text_splitter.split_text(doc.page_content)
+    for doc, tokens in zip(docs, all_tokens):
+        token_bytes = encoding.decode_tokens_bytes(tokens)
+        chunks = [
+            encoding.decode(tokens[start:stop]).strip()
+            for start, stop in split_tokens(token_bytes, chunk_size, chunk_overlap)
+        ]
+        chunks = [chunk for chunk in chunks if chunk]
 
+        location = doc_location(doc.metadata)
         for i, chunk in enumerate(chunks):
-            doc = Document(
-                page_content=chunk,
-                metadata={
-                    "page": doc.metadata.get("page", 1),
-                    "chunk": i + 1,
-                    "source": f"{doc.metadata.get('page', 1)}-{i + 1}",
-                },
+            chunked_docs.append(
+                Document(
+                    page_content=chunk,
+                    metadata={
+                        **doc.metadata,
+                        "chunk": i + 1,
+                        "source": f"{location}-{i + 1}",
+                    },
+                )
             )
-            chunked_docs.append(doc)
+
+    return chunked_docs
+
+
+def chunk_file(
+    file: File, chunk_size: int, chunk_overlap: int = 0, model_name="gpt-3.5-turbo"
+) -> File:
+    """Chunks each document in a file into smaller documents
+    according to the specified chunk size and overlap
+    where the size is determined by the number of token for the specified model.
+    """
 
     chunked_file = file.copy()
-    chunked_file.docs = chunked_docs
+    chunked_file.docs = chunk_docs(file.docs, chunk_size, chunk_overlap, model_name)
     return chunked_file
+
+
+def _doc_batches(docs: List[Document], max_chars: int) -> List[List[Document]]:
+    """Groups consecutive documents into batches of about max_chars characters"""
+    batches: List[List[Document]] = [[]]
+    size = 0
+    for doc in docs:
+        if batches[-1] and size + len(doc.page_content) > max_chars:
+            batches.append([])
+            size = 0
+        batches[-1].append(doc)
+        size += len(doc.page_content)
+    return batches
+
+
+def chunk_files(
+    files: List[File],
+    chunk_size: int,
+    chunk_overlap: int = 0,
+    model_name="gpt-3.5-turbo",
+    workers: int = CHUNK_WORKERS,
+) -> List[File]:
+    """Chunks a list of files like chunk_file, spreading files and page
+    batches of large files across worker processes.
+    Chunk sources only depend on the page and position of a chunk in its
+    document, so the result is the same as chunking the files one by one.
+    """
+
+    total_chars = sum(len(doc.page_content) for file in files for doc in file.docs)
+    if workers <= 1 or total_chars < MIN_PARALLEL_CHARS:
+        return [chunk_file(file, chunk_size, chunk_overlap, model_name) for file in files]
+
+    tasks = [
+        (i, batch)
+        for i, file in enumerate(files)
+        for batch in _doc_batches(file.docs, CHARS_PER_TASK)
+    ]
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        results = pool.map(
+            chunk_docs,
+            [batch for _, batch in tasks],
+            [chunk_size] * len(tasks),
+            [chunk_overlap] * len(tasks),
+            [model_name] * len(tasks),
+        )
+        chunked_docs: List[List[Document]] = [[] for _ in files]
+        for (i, _), docs in zip(tasks, results):
+            chunked_docs[i].extend(docs)
+
+    chunked_files = []
+    for file, docs in zip(files, chunked_docs):
+        chunked_file = file.copy()
+        chunked_file.docs = docs
+        chunked_files.append(chunked_file)
+    return chunked_files
+
+
+def iter_chunk_batches(
+    batches: Iterator[List[Document]],
+    chunk_size: int,
+    chunk_overlap: int = 0,
+    model_name="gpt-3.5-turbo",
+    workers: int = CHUNK_WORKERS,
+) -> Iterator[Tuple[List[Document], List[Document]]]:
+    """Chunks batches of documents as they are parsed, yielding every batch
+    along with its chunks in order.
+    Batches are chunked in process until MIN_PARALLEL_CHARS characters have
+    come in, the rest of a large file is spread across worker processes
+    that chunk while the next batches are parsed.
+    """
+
+    pool: Optional[ProcessPoolExecutor] = None
+    pending: Deque[Tuple[List[Document], Future]] = deque()
+    total_chars = 0
+    try:
+        for docs in batches:
+            total_chars += sum(len(doc.page_content) for doc in docs)
+            if pool is None and workers > 1 and total_chars >= MIN_PARALLEL_CHARS:
+                context = multiprocessing.get_context("spawn")
+                pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+            if pool is None:
+                yield docs, chunk_docs(docs, chunk_size, chunk_overlap, model_name)
+                continue
+
+            pending.append(
+                (docs, pool.submit(chunk_docs, docs, chunk_size, chunk_overlap, model_name))
+            )
+            # keep every worker busy while the parser moves on
+            while len(pending) > workers:
+                docs, future = pending.popleft()
+                yield docs, future.result()
+        while pending:
+            docs, future = pending.popleft()
+            yield docs, future.result()
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
@@ -14,6 +14,8 @@ class FakeChatModel(FakeListChatModel):
 
 
 class FakeEmbeddings(FakeEmbeddingsBase):
+    queries_as_documents: bool = True
+
     def __init__(self, **kwargs):
         super().__init__(size=4, **kwargs)
 
@@ -21,14 +23,28 @@ class FakeEmbeddings(FakeEmbeddingsBase):
 class FakeVectorStore(VectorStore):
     """Fake vector store for testing purposes."""
 
-    def __init__(self, texts: List[str]):
+    def __init__(self, texts: List[str], ids: Optional[List[str]] = None):
         self.texts: List[str] = texts
+        self.ids: List[str] = ids or [str(i) for i in range(len(texts))]
 
     def add_texts(
-        self, texts: Iterable[str], metadatas: List[dict] | None = None, **kwargs: Any
+        self,
+        texts: Iterable[str],
+        metadatas: List[dict] | None = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
     ) -> List[str]:
+        texts = list(texts)
+        ids = ids or [str(len(self.ids) + i) for i in range(len(texts))]
         self.texts.extend(texts)
-        return self.texts
+        self.ids.extend(ids)
+        return ids
+
+    def delete(self, ids: List[str]) -> None:
+        deleted = set(ids)
+        kept = [(i, text) for i, text in zip(self.ids, self.texts) if i not in deleted]
+        self.ids = [i for i, _ in kept]
+        self.texts = [text for _, text in kept]
 
     @classmethod
     def from_texts(
@@ -36,9 +52,10 @@ class FakeVectorStore(VectorStore):
         texts: List[str],
         embedding: Embeddings,
         metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
         **kwargs: Any,
     ) -> "FakeVectorStore":
-        return cls(texts=list(texts))
+        return cls(texts=list(texts), ids=ids)
 
     def similarity_search(
         self, query: str, k: int = 4, **kwargs: Any
@@ -0,0 +1,106 @@
+import re
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document
+
+# number of hash permutations in a MinHash signature
+NUM_PERM = 64
+# signatures are split in this many bands for locality sensitive hashing,
+# with 8 rows per band pairs above ~0.77 similarity are likely to collide
+BANDS = 8
+# estimated Jaccard similarity above which two chunks are duplicates
+THRESHOLD = 0.8
+# chunks are compared on sets of this many consecutive words
+SHINGLE_WORDS = 3
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_random = np.random.RandomState(1)
+_A = _random.randint(1, 1 << 31, size=NUM_PERM, dtype=np.uint64)
+_B = _random.randint(0, 1 << 31, size=NUM_PERM, dtype=np.uint64)
+
+
+def minhash(text: str) -> np.ndarray:
+    """MinHash signature of the word shingles of a text"""
+    words = re.findall(r"\w+", text.lower())
+    shingles = {
+        " ".join(words[i:i + SHINGLE_WORDS])
+        for i in range(max(1, len(words) - SHINGLE_WORDS + 1))
+    }
+    hashes = np.array(
+        [zlib.crc32(shingle.encode("utf-8")) for shingle in shingles], dtype=np.uint64
+    )
+    # (a * h + b) mod p stays below 2 ** 64 as a < 2 ** 31 and h < 2 ** 32
+    permuted = (_A[:, None] * hashes[None, :] + _B[:, None]) % _MERSENNE_PRIME
+    return permuted.min(axis=1)
+
+
+class DuplicateFilter:
+    """Collapses near-duplicate chunks with MinHash and LSH.
+
+    The first chunk of a group is kept and indexed, later near-duplicates
+    are not, their locations are added to its "sources" metadata instead
+    so citations can point to every copy.
+    Locations of removed files are dropped again with remove_files.
+    """
+
+    def __init__(self, threshold: float = THRESHOLD):
+        self.threshold = threshold
+        self.buckets: Dict[Tuple[int, bytes], List[int]] = {}
+        self.signatures: List[np.ndarray] = []
+        self.docs: List[Optional[Document]] = []
+        # kept chunks with a location in each file, by file id
+        self.by_file: Dict[str, List[int]] = {}
+
+    @staticmethod
+    def _location(doc: Document) -> dict:
+        return {
+            "file_name": doc.metadata.get("file_name"),
+            "file_id": doc.metadata.get("file_id"),
+            "source": doc.metadata.get("source"),
+        }
+
+    def add(self, doc: Document) -> Optional[Document]:
+        """Registers a chunk, returns the chunk it duplicates or None if it is new"""
+        signature = minhash(doc.page_content)
+        keys = [
+            (band, signature[band::BANDS].tobytes()) for band in range(BANDS)
+        ]
+
+        candidates = {i for key in keys for i in self.buckets.get(key, [])}
+        location = self._location(doc)
+        for i in sorted(candidates):
+            original = self.docs[i]
+            if original is not None and np.mean(self.signatures[i] == signature) >= self.threshold:
+                original.metadata["sources"].append(location)
+                self.by_file.setdefault(location["file_id"], []).append(i)
+                return original
+
+        doc.metadata["sources"] = [location]
+        for key in keys:
+            self.buckets.setdefault(key, []).append(len(self.docs))
+        self.by_file.setdefault(location["file_id"], []).append(len(self.docs))
+        self.signatures.append(signature)
+        self.docs.append(doc)
+        return None
+
+    def filter(self, docs: List[Document]) -> List[Document]:
+        """Returns the chunks of docs that are not duplicates"""
+        return [doc for doc in docs if self.add(doc) is None]
+
+    def remove_files(self, file_ids: List[str]) -> None:
+        """Drops the locations of files from the sources of the kept chunks,
+        chunks left without any location are forgotten
+        """
+        removed = set(file_ids)
+        for i in {i for file_id in removed for i in self.by_file.pop(file_id, [])}:
+            doc = self.docs[i]
+            if doc is None:
+                continue
+            doc.metadata["sources"] = [
+                location for location in doc.metadata["sources"]
+                if location["file_id"] not in removed
+            ]
+            if not doc.metadata["sources"]:
+                self.docs[i] = None
@@ -1,20 +1,106 @@
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import uuid
+
+import numpy as np
 from langchain.vectorstores import VectorStore
-from Main.core.parsing import File
+from Main.core.parsing import PARSER_VERSION, File
+from Main.core.chunking import CHUNKER_VERSION
 from langchain.vectorstores.faiss import FAISS
-from langchain.embeddings import OpenAIEmbeddings
+from langchain.vectorstores.utils import maximal_marginal_relevance
 from langchain.embeddings.base import Embeddings
-from typing import List, Type
+from typing import Any, Dict, List, Optional, Type
 from langchain.docstore.document import Document
 from Main.core.debug import FakeVectorStore, FakeEmbeddings
+from Main.core.bm25 import BM25Index, fuse_rankings
+from Main.core.dedup import DuplicateFilter
+from Main.core.embedding_cache import CachedEmbeddings, model_name
+from Main.core.embedding_scheduler import ScheduledOpenAIEmbeddings
+from Main.core.index_store import (
+    INDEX_DIR,
+    MANIFEST_FILE,
+    STORE_FILE,
+    VECTORS_FILE,
+    find_index,
+    folder_hash,
+    index_path,
+    publish_index,
+)
+from Main.core.index_types import (
+    HNSW_MAX_DELETED,
+    INDEX_STORAGE,
+    INDEX_TARGET,
+    IndexConfig,
+    add_vectors,
+    build_index,
+    choose_index_config,
+    index_vectors,
+    is_memory_mapped,
+    reconstruct,
+    remove_vectors,
+)
+
+# default retrieval of FolderIndex.search: "auto", "hybrid", "dense" or "lexical"
+SEARCH_MODE = os.environ.get("SEARCH_MODE", "auto")
+SEARCH_MODES = ["auto", "hybrid", "dense", "lexical"]
+# hybrid search fuses this many times k candidates from each ranking
+FUSION_FETCH_FACTOR = 4
 
 
 class FolderIndex:
-    """Index for a collection of files (a folder)"""
+    """Index for a collection of files (a folder).
+    Files can be added and removed in place, the index keeps track of
+    the ids of the chunks each file has in the vector store.
+    """
 
-    def __init__(self, files: List[File], index: VectorStore):
+    def __init__(
+        self,
+        files: List[File],
+        index: VectorStore,
+        duplicates: Optional[DuplicateFilter] = None,
+        embeddings: Optional[Embeddings] = None,
+        ids: Optional[Dict[str, Dict[str, Document]]] = None,
+        index_config: Optional[IndexConfig] = None,
+        bm25: Optional[BM25Index] = None,
+        settings: Optional[Dict[str, Any]] = None,
+    ):
         self.name: str = "default"
         self.files = files
         self.index: VectorStore = index
+        # embeds the documents added later on, through the embedding cache
+        self.embeddings = embeddings
+        # near-duplicate chunks are only embedded and indexed once
+        self.duplicates = duplicates or DuplicateFilter()
+        # chunks each file owns in the vector store, by file id and store id
+        self.ids: Dict[str, Dict[str, Document]] = ids or {}
+        # type of the faiss index, None for other vector stores
+        self.index_config = index_config
+        # keyword index over the same chunks, for hybrid and lexical search
+        if bm25 is None:
+            bm25 = BM25Index()
+            for docs in self.ids.values():
+                for doc_id, doc in docs.items():
+                    bm25.add(doc_id, doc.page_content)
+        self.bm25 = bm25
+        # parser, chunking and embedding settings the index was built with, part of its key
+        self.settings = settings or {}
+        # IVF lists loaded from disk are memory mapped read only until the index changes
+        self.mapped = False
+        # guards the index while files are added or removed
+        self.lock = threading.RLock()
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
 
     @staticmethod
     def _combine_files(files: List[File]) -> List[Document]:
@@ -29,46 +115,524 @@ class FolderIndex:
 
         return all_texts
 
+    @staticmethod
+    def _track(ids: Dict[str, Dict[str, Document]], docs: List[Document]) -> List[str]:
+        """Assigns a store id to each document, returns the new ids"""
+        doc_ids = [str(uuid.uuid4()) for _ in docs]
+        for doc_id, doc in zip(doc_ids, docs):
+            ids.setdefault(doc.metadata["file_id"], {})[doc_id] = doc
+        return doc_ids
+
     @classmethod
     def from_files(
-        cls, files: List[File], embeddings: Embeddings, vector_store: Type[VectorStore]
+        cls,
+        files: List[File],
+        embeddings: Embeddings,
+        vector_store: Type[VectorStore],
+        index_target: str = INDEX_TARGET,
+        index_storage: str = INDEX_STORAGE,
+        settings: Optional[Dict[str, Any]] = None,
     ) -> "FolderIndex":
-        """Creates an index from files."""
+        """Creates an index from files.
+        Chunks embedded before, by any folder, are read from the embedding cache.
+        FAISS indexes are flat, IVF or HNSW depending on the number of chunks,
+        see Main.core.index_types.
+        """
+
+        from langchain.docstore.in_memory import InMemoryDocstore
+
+        if not isinstance(embeddings, CachedEmbeddings):
+            embeddings = CachedEmbeddings(embeddings)
 
         all_docs = cls._combine_files(files)
+        duplicates = DuplicateFilter()
+        unique_docs = duplicates.filter(all_docs)
+        ids: Dict[str, Dict[str, Document]] = {}
+        doc_ids = cls._track(ids, unique_docs)
 
-        index = vector_store.from_documents(
-            documents=all_docs,
-            embedding=embeddings,
+        if not issubclass(vector_store, FAISS):
+            index = vector_store.from_documents(
+                documents=unique_docs,
+                embedding=embeddings,
+                ids=doc_ids,
+            )
+            return cls(
+                files=files,
+                index=index,
+                duplicates=duplicates,
+                embeddings=embeddings,
+                ids=ids,
+                settings=settings,
+            )
+
+        vectors = np.array(
+            embeddings.embed_documents([doc.page_content for doc in unique_docs]),
+            dtype=np.float32,
+        )
+        index_config = choose_index_config(
+            len(vectors), vectors.shape[1], index_target, index_storage
+        )
+        index = FAISS(
+            embeddings.embed_query,
+            build_index(index_config, vectors),
+            InMemoryDocstore(dict(zip(doc_ids, unique_docs))),
+            dict(enumerate(doc_ids)),
+        )
+        return cls(
+            files=files,
+            index=index,
+            duplicates=duplicates,
+            embeddings=embeddings,
+            ids=ids,
+            index_config=index_config,
+            settings=settings,
         )
 
-        return cls(files=files, index=index)
+    def rebuild(self, index_config: IndexConfig) -> None:
+        """Rebuilds the faiss index with another configuration from its own vectors,
+        leaving out the vectors of removed documents
+        """
 
+        with self.lock:
+            mapping = self.index.index_to_docstore_id
+            labels = sorted(mapping)
+            vectors = index_vectors(self.index.index, labels)
+            self.index.index = build_index(index_config, vectors)
+            self.index.index_to_docstore_id = {i: mapping[label] for i, label in enumerate(labels)}
+            self.index_config = index_config
+            self.mapped = False
 
-def embed_files(
-    files: List[File], embedding: str, vector_store: str, **kwargs
-) -> FolderIndex:
-    """Embeds a collection of files and stores them in a FolderIndex."""
+    def _deleted(self) -> int:
+        """Vectors of removed documents still in the faiss index, hnsw cannot remove them"""
+        return self.index.index.ntotal - len(self.index.index_to_docstore_id)
+
+    def optimize(self) -> None:
+        """Switches to the index type that suits the current number of chunks,
+        e.g. once a folder that started small has grown past FLAT_MAX_VECTORS
+        """
+
+        if self.index_config is None:
+            return
+        with self.lock:
+            index_config = choose_index_config(
+                len(self.index.index_to_docstore_id),
+                self.index.index.d,
+                self.index_config.target,
+                self.index_config.storage,
+            )
+            if index_config != self.index_config:
+                self.rebuild(index_config)
+
+    @property
+    def key(self) -> str:
+        """Content hash of the folder and its settings, the index is saved under it"""
+        return folder_hash((file.id for file in self.files), self.settings)
+
+    def _ensure_writable(self) -> None:
+        """Rebuilds memory mapped vectors in memory before the index changes,
+        faiss cannot clone or write to IVF lists mapped read only
+        """
+        if self.mapped:
+            self.rebuild(self.index_config)
+
+    def save(self, directory: str = INDEX_DIR) -> Optional[str]:
+        """Saves the vectors, docstore and file manifest under the folder's content hash.
+        Only FAISS indexes are saved, returns the index directory or None.
+        """
+        import faiss
+
+        if not isinstance(self.index, FAISS):
+            return None
+        with self.lock:
+            key = self.key
+            if find_index(key, directory):
+                return index_path(key, directory)
+
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = tempfile.mkdtemp(dir=directory, prefix=".")
+            try:
+                faiss.write_index(self.index.index, os.path.join(tmp_path, VECTORS_FILE))
+                with open(os.path.join(tmp_path, STORE_FILE), "wb") as f:
+                    pickle.dump(
+                        {
+                            "name": self.name,
+                            "files": self.files,
+                            "duplicates": self.duplicates,
+                            "ids": self.ids,
+                            "docstore": self.index.docstore,
+                            "index_to_docstore_id": self.index.index_to_docstore_id,
+                            "index_config": self.index_config,
+                            "bm25": self.bm25,
+                            "settings": self.settings,
+                        },
+                        f,
+                        protocol=pickle.HIGHEST_PROTOCOL,
+                    )
+                manifest = {
+                    "model": model_name(self.embeddings) if self.embeddings else None,
+                    "vectors": self.index.index.ntotal,
+                    "index_config": self.index_config._asdict() if self.index_config else None,
+                    "settings": self.settings,
+                    "files": [
+                        {"name": file.name, "id": file.id, "chunks": len(file.docs)}
+                        for file in self.files
+                    ],
+                }
+                with open(os.path.join(tmp_path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+                    json.dump(manifest, f)
+            except (OSError, RuntimeError) as e:
+                print(f"Error: {e}")
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                return None
+        return publish_index(tmp_path, key, directory)
+
+    @classmethod
+    def load(
+        cls, key: str, embeddings: Embeddings, directory: str = INDEX_DIR
+    ) -> Optional["FolderIndex"]:
+        """Loads a saved index without embedding anything, None if there is none.
+
+        Only IVF indexes share memory between processes: faiss memory maps
+        their inverted lists, so processes opening the same folder share the
+        pages. IVF is only chosen for large folders with the "latency" target
+        or "pq" storage. With the default settings folders get a flat index
+        below FLAT_MAX_VECTORS chunks and an HNSW index above it, and both are
+        read into the memory of every process that loads them.
+        """
+        import faiss
+        from langchain.docstore.in_memory import InMemoryDocstore
+
+        path = find_index(key, directory)
+        if path is None:
+            return None
+        if not isinstance(embeddings, CachedEmbeddings):
+            embeddings = CachedEmbeddings(embeddings)
+        try:
+            with open(os.path.join(path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest["model"] not in (None, embeddings.model):
+                return None
+            vectors_path = os.path.join(path, VECTORS_FILE)
+            try:
+                vectors = faiss.read_index(
+                    vectors_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+                )
+            except RuntimeError:
+                vectors = faiss.read_index(vectors_path)
+            with open(os.path.join(path, STORE_FILE), "rb") as f:
+                store = pickle.load(f)
+        except (OSError, RuntimeError, ValueError, KeyError, pickle.UnpicklingError) as e:
+            print(f"Error: {e}")
+            return None
+
+        docstore: InMemoryDocstore = store["docstore"]
+        index = FAISS(embeddings.embed_query, vectors, docstore, store["index_to_docstore_id"])
+        folder_index = cls(
+            files=store["files"],
+            index=index,
+            duplicates=store["duplicates"],
+            embeddings=embeddings,
+            ids=store["ids"],
+            index_config=store.get("index_config"),
+            bm25=store.get("bm25"),
+            settings=store.get("settings"),
+        )
+        folder_index.name = store["name"]
+        # only IVF lists are actually mapped, the flag is ignored for other types
+        folder_index.mapped = folder_index.index_config is not None and is_memory_mapped(vectors)
+        return folder_index
+
+    def _embed_docs(self, docs: List[Document]) -> Optional[List[List[float]]]:
+        """Embeds documents in one batch for the faiss index, None for vector
+        stores that embed on their own. Called without the lock, it waits on the model.
+        """
+        if self.embeddings is None or not hasattr(self.index, "add_embeddings"):
+            return None
+        return self.embeddings.embed_documents([doc.page_content for doc in docs])
+
+    def _embed_query(self, query: str) -> np.ndarray:
+        """Embeds a query for a faiss search, called without the lock"""
+        return np.array([self.index.embedding_function(query)], dtype=np.float32)
+
+    def _add_to_index(self, docs: List[Document], vectors: Optional[List[List[float]]]) -> None:
+        """Adds documents and their vectors from _embed_docs to the index"""
+        self._ensure_writable()
+        doc_ids = self._track(self.ids, docs)
+        for doc_id, doc in zip(doc_ids, docs):
+            self.bm25.add(doc_id, doc.page_content)
+        if vectors is None:
+            self.index.add_documents(docs, ids=doc_ids)
+            return
+        mapping = self.index.index_to_docstore_id
+        labels = add_vectors(self.index.index, np.array(vectors), max(mapping, default=-1) + 1)
+        mapping.update(zip(labels, doc_ids))
+        self.index.docstore.add(dict(zip(doc_ids, docs)))
+
+    def _delete_from_index(self, doc_ids: List[str]) -> None:
+        """Removes documents from the vector store by id"""
+        if not isinstance(self.index, FAISS):
+            self.index.delete(doc_ids)
+            return
+        self._ensure_writable()
+        deleted = set(doc_ids)
+        mapping = self.index.index_to_docstore_id
+        labels = [i for i, doc_id in mapping.items() if doc_id in deleted]
+        kind = self.index_config.kind if self.index_config else "flat"
+        if kind == "flat":
+            self.index.index.remove_ids(np.array(labels, dtype=np.int64))
+            # the vectors after the removed ones move down
+            remaining = [doc_id for _, doc_id in sorted(mapping.items()) if doc_id not in deleted]
+            self.index.index_to_docstore_id = dict(enumerate(remaining))
+        else:
+            if kind == "ivf":
+                remove_vectors(self.index.index, labels)
+            # hnsw keeps the vectors, searches skip labels missing from the mapping
+            for label in labels:
+                del mapping[label]
+            if self._deleted() > HNSW_MAX_DELETED * self.index.index.ntotal:
+                self.rebuild(choose_index_config(
+                    len(mapping), self.index.index.d, self.index_config.target, self.index_config.storage
+                ))
+        for doc_id in doc_ids:
+            self.index.docstore._dict.pop(doc_id, None)
+
+    def has_file(self, file_id: str) -> bool:
+        return any(file.id == file_id for file in self.files)
+
+    def add_docs(self, file: File, docs: List[Document]) -> None:
+        """Adds chunked documents of a file to the index,
+        the file is added to the folder if it is not part of it yet.
+        The documents are embedded without holding the lock, queries are
+        answered while a batch waits on the embedding model.
+        """
+
+        with self.lock:
+            folder_file = next((f for f in self.files if f.id == file.id), None)
+            if folder_file is None:
+                folder_file = file
+                self.files.append(folder_file)
+
+            for doc in docs:
+                doc.metadata["file_name"] = folder_file.name
+                doc.metadata["file_id"] = folder_file.id
+            unique_docs = self.duplicates.filter(docs)
+
+        vectors = self._embed_docs(unique_docs) if unique_docs else None
+        with self.lock:
+            if unique_docs:
+                self._add_to_index(unique_docs, vectors)
+            folder_file.docs.extend(docs)
+
+    def add_files(self, files: List[File]) -> None:
+        """Adds chunked files to the index, files already in it are skipped."""
+
+        for file in files:
+            if self.has_file(file.id):
+                continue
+            folder_file = file.copy()
+            folder_file.docs = []
+            self.add_docs(folder_file, file.docs)
+
+    def remove_files(self, file_ids: List[str]) -> None:
+        """Removes files and their chunks from the index.
+        A chunk that is also a near-duplicate of a chunk in a remaining file
+        stays in the index and now points to that file.
+        """
+
+        with self.lock:
+            self.duplicates.remove_files(file_ids)
+            deleted = []
+            for file_id in file_ids:
+                for doc_id, doc in self.ids.pop(file_id, {}).items():
+                    sources = doc.metadata["sources"]
+                    if sources:
+                        doc.metadata.update(sources[0])
+                        self.ids.setdefault(sources[0]["file_id"], {})[doc_id] = doc
+                    else:
+                        deleted.append(doc_id)
+                        self.bm25.remove(doc_id, doc.page_content)
+            if deleted:
+                self._delete_from_index(deleted)
+            self.files[:] = [file for file in self.files if file.id not in file_ids]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        """Returns the k documents most similar to the query."""
+
+        if not isinstance(self.index, FAISS):
+            with self.lock:
+                return self.index.similarity_search(query, k=k, **kwargs)
+        vector = self._embed_query(query)
+        with self.lock:
+            return [self._doc(doc_id) for doc_id in self._dense_search(vector, k)]
+
+    def _doc(self, doc_id: str) -> Document:
+        if isinstance(self.index, FAISS):
+            return self.index.docstore.search(doc_id)
+        return next(docs[doc_id] for docs in self.ids.values() if doc_id in docs)
+
+    def _dense_search(self, vector: np.ndarray, k: int) -> List[str]:
+        """Store ids of the k chunks closest to a query vector in the faiss index"""
+        mapping = self.index.index_to_docstore_id
+        _, labels = self.index.index.search(vector, k + self._deleted())
+        return [mapping[i] for i in labels[0] if i in mapping][:k]
+
+    def search(self, query: str, k: int = 4, mode: str = SEARCH_MODE) -> List[Document]:
+        """Returns the k documents most relevant to the query.
+
+        "dense" ranks by embedding similarity and "lexical" with BM25, without
+        embedding the query. "hybrid" fuses both rankings with reciprocal rank
+        fusion. "auto" answers keyword queries lexically when BM25 finds k
+        matches and the best one holds every term or scores high enough, see
+        BM25Index.is_confident, and falls back to hybrid search otherwise.
+        """
+
+        if mode not in SEARCH_MODES:
+            raise NotImplementedError(f"Search mode {mode} not supported.")
+
+        if mode in ("lexical", "auto"):
+            with self.lock:
+                hits = self.bm25.search(query, k)
+                if mode == "lexical" or (len(hits) >= k and self.bm25.is_confident(query, hits)):
+                    return [self._doc(doc_id) for doc_id, _ in hits]
+        if mode == "dense" or not isinstance(self.index, FAISS):
+            return self.similarity_search(query, k=k)
+
+        # the query is embedded before taking the lock, ingestion keeps adding batches
+        vector = self._embed_query(query)
+        fetch_k = k * FUSION_FETCH_FACTOR
+        with self.lock:
+            lexical = [doc_id for doc_id, _ in self.bm25.search(query, fetch_k)]
+            dense = self._dense_search(vector, fetch_k)
+            return [self._doc(doc_id) for doc_id in fuse_rankings([dense, lexical], k)]
+
+    def batch_search(
+        self,
+        queries: List[str],
+        k: int = 4,
+        mmr: bool = False,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+    ) -> List[List[Document]]:
+        """Returns up to k relevant documents for each query.
+
+        Queries are embedded in one request, or concurrently for models with
+        a query embedding of their own, and searched with a single faiss call. A document is only returned for the first query that finds it,
+        with mmr the results of each query are also picked for diversity.
+        """
+
+        if not queries:
+            return []
+        if not isinstance(self.index, FAISS) or self.embeddings is None:
+            results, seen = [], set()
+            for query in queries:
+                docs = [
+                    doc for doc in self.similarity_search(query, k=max(k, fetch_k))
+                    if doc.page_content not in seen
+                ][:k]
+                seen.update(doc.page_content for doc in docs)
+                results.append(docs)
+            return results
+
+        if isinstance(self.embeddings, CachedEmbeddings):
+            vectors = self.embeddings.embed_queries(queries)
+        else:
+            vectors = [self.embeddings.embed_query(query) for query in queries]
+        vectors = np.array(vectors, dtype=np.float32)
+        with self.lock:
+            mapping = self.index.index_to_docstore_id
+            _, labels = self.index.index.search(vectors, max(k, fetch_k) + self._deleted())
+
+            results, seen = [], set()
+            for vector, row in zip(vectors, labels):
+                candidates = [
+                    int(i) for i in row if int(i) in mapping and mapping[int(i)] not in seen
+                ][:max(k, fetch_k)]
+                if mmr and candidates:
+                    selected = maximal_marginal_relevance(
+                        vector,
+                        list(reconstruct(self.index.index, candidates)),
+                        lambda_mult=lambda_mult,
+                        k=k,
+                    )
+                    candidates = [candidates[i] for i in selected]
+                doc_ids = [mapping[i] for i in candidates[:k]]
+                seen.update(doc_ids)
+                results.append([self._doc(doc_id) for doc_id in doc_ids])
+            return results
+
+
+def get_embeddings(embedding: str, **kwargs) -> Embeddings:
+    """Creates the embeddings model with the given name."""
 
     supported_embeddings: dict[str, Type[Embeddings]] = {
-        "openai": OpenAIEmbeddings,
+        "openai": ScheduledOpenAIEmbeddings,
         "debug": FakeEmbeddings,
     }
-    supported_vector_stores: dict[str, Type[VectorStore]] = {
-        "faiss": FAISS,
-        "debug": FakeVectorStore,
-    }
 
     if embedding in supported_embeddings:
-        _embeddings = supported_embeddings[embedding](**kwargs)
+        return supported_embeddings[embedding](**kwargs)
     else:
         raise NotImplementedError(f"Embedding {embedding} not supported.")
 
+
+def get_vector_store(vector_store: str) -> Type[VectorStore]:
+    """Returns the vector store class with the given name."""
+
+    supported_vector_stores: dict[str, Type[VectorStore]] = {
+        "faiss": FAISS,
+        "debug": FakeVectorStore,
+    }
+
     if vector_store in supported_vector_stores:
-        _vector_store = supported_vector_stores[vector_store]
+        return supported_vector_stores[vector_store]
     else:
         raise NotImplementedError(f"Vector store {vector_store} not supported.")
 
-    return FolderIndex.from_files(
-        files=files, embeddings=_embeddings, vector_store=_vector_store
+
+def index_settings(
+    embeddings: Embeddings, chunk_size: int, chunk_overlap: int = 0, ocr_enabled: bool = False
+) -> Dict[str, Any]:
+    """What the chunks and vectors of a folder depend on besides its files,
+    folders indexed with other settings are saved under another key
+    """
+    return {
+        "parser": PARSER_VERSION,
+        "chunker": CHUNKER_VERSION,
+        "ocr": ocr_enabled,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "model": model_name(embeddings),
+    }
+
+
+def embed_files(
+    files: List[File],
+    embedding: str,
+    vector_store: str,
+    chunk_size: int = 0,
+    chunk_overlap: int = 0,
+    index_target: str = INDEX_TARGET,
+    index_storage: str = INDEX_STORAGE,
+    **kwargs,
+) -> FolderIndex:
+    """Embeds a collection of files and stores them in a FolderIndex.
+    A folder saved before with the same chunking and model is loaded from
+    disk instead of being embedded again.
+    """
+
+    embeddings = get_embeddings(embedding, **kwargs)
+    settings = index_settings(embeddings, chunk_size, chunk_overlap)
+    folder_index = FolderIndex.load(folder_hash((file.id for file in files), settings), embeddings)
+    if folder_index is not None:
+        return folder_index
+
+    folder_index = FolderIndex.from_files(
+        files=files,
+        embeddings=embeddings,
+        vector_store=get_vector_store(vector_store),
+        index_target=index_target,
+        index_storage=index_storage,
+        settings=settings,
     )
+    folder_index.save()
+    return folder_index
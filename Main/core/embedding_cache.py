@@ -0,0 +1,307 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+from Main.core.embedding_scheduler import EMBED_CONCURRENCY
+
+# sqlite database holding the cached vectors, can live on a volume shared by replicas
+EMBEDDING_CACHE_PATH = os.environ.get(
+    "EMBEDDING_CACHE_PATH",
+    os.path.join(tempfile.gettempdir(), "deck_summarizer", "embeddings.sqlite"),
+)
+# least recently used vectors are evicted once the cache grows past this size
+EMBEDDING_CACHE_MAX_BYTES = int(os.environ.get("EMBEDDING_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+# vectors are stored as float16, half the size of float32 for a negligible loss
+EMBEDDING_CACHE_DTYPE = np.float16
+# number of query embeddings kept in memory by the process
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", 4096))
+# query embeddings are also written to the embedding cache so they survive restarts
+QUERY_CACHE_PERSIST = bool(int(os.environ.get("QUERY_CACHE_PERSIST", 1)))
+
+
+def normalize_query(text: str) -> str:
+    """Query text with unicode forms and runs of whitespace made uniform"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def embeds_queries_as_documents(embeddings: Embeddings) -> bool:
+    """Whether a model embeds a query exactly like a document, its queries
+    can then be batched through embed_documents
+    """
+    return bool(getattr(embeddings, "queries_as_documents", False))
+
+
+def model_name(embeddings: Embeddings) -> str:
+    """Name of the model behind an embeddings object, part of every cache key"""
+    return getattr(embeddings, "model", None) or embeddings.__class__.__name__
+
+
+class EmbeddingCache:
+    """Content addressed store of embedding vectors in a sqlite database.
+
+    Connections are opened per call so the cache can be shared between
+    threads and processes, and pickled along with a FolderIndex.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=30)
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+            )
+            # a single row keeps the size of the table up to date so eviction
+            # does not have to sum every vector on each write
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings_size ("
+                "id INTEGER PRIMARY KEY CHECK (id = 0), "
+                "bytes INTEGER NOT NULL, entries INTEGER NOT NULL)"
+            )
+            connection.execute(
+                "CREATE TRIGGER IF NOT EXISTS embeddings_insert AFTER INSERT ON embeddings BEGIN "
+                "UPDATE embeddings_size SET bytes = bytes + LENGTH(NEW.vector), "
+                "entries = entries + 1; END"
+            )
+            connection.execute(
+                "CREATE TRIGGER IF NOT EXISTS embeddings_update "
+                "AFTER UPDATE OF vector ON embeddings BEGIN "
+                "UPDATE embeddings_size "
+                "SET bytes = bytes + LENGTH(NEW.vector) - LENGTH(OLD.vector); END"
+            )
+            connection.execute(
+                "CREATE TRIGGER IF NOT EXISTS embeddings_delete AFTER DELETE ON embeddings BEGIN "
+                "UPDATE embeddings_size SET bytes = bytes - LENGTH(OLD.vector), "
+                "entries = entries - 1; END"
+            )
+            # caches created before the size row existed are summed once
+            connection.execute(
+                "INSERT OR IGNORE INTO embeddings_size (id, bytes, entries) "
+                "SELECT 0, COALESCE(SUM(LENGTH(vector)), 0), COUNT(*) FROM embeddings "
+                "WHERE NOT EXISTS (SELECT 1 FROM embeddings_size)"
+            )
+            connection.commit()
+            self._initialized = True
+        return connection
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """Returns the cached vectors of the keys that are in the cache"""
+        found: Dict[str, List[float]] = {}
+        try:
+            with self._connect() as connection:
+                # stay below sqlite's limit on query parameters
+                for i in range(0, len(keys), 500):
+                    batch = keys[i:i + 500]
+                    placeholders = ",".join("?" * len(batch))
+                    rows = connection.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                        batch,
+                    ).fetchall()
+                    for key, vector in rows:
+                        found[key] = np.frombuffer(vector, dtype=EMBEDDING_CACHE_DTYPE).astype(
+                            np.float32
+                        ).tolist()
+                    connection.executemany(
+                        "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                        [(time.time(), key) for key, _ in rows],
+                    )
+        except sqlite3.Error as e:
+            print(f"Error: {e}")
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def put_many(self, vectors: Dict[str, List[float]]) -> None:
+        """Stores vectors and evicts old ones if the cache is over its size cap"""
+        now = time.time()
+        try:
+            with self._connect() as connection:
+                # an upsert, rows replaced by INSERT OR REPLACE do not fire the delete trigger
+                connection.executemany(
+                    "INSERT INTO embeddings (key, vector, last_used) VALUES (?, ?, ?) "
+                    "ON CONFLICT (key) DO UPDATE SET "
+                    "vector = excluded.vector, last_used = excluded.last_used",
+                    [
+                        (key, np.asarray(vector, dtype=EMBEDDING_CACHE_DTYPE).tobytes(), now)
+                        for key, vector in vectors.items()
+                    ],
+                )
+                self._evict(connection)
+        except sqlite3.Error as e:
+            print(f"Error: {e}")
+
+    @staticmethod
+    def _size(connection: sqlite3.Connection) -> Tuple[int, int]:
+        """Bytes and number of vectors in the cache"""
+        row = connection.execute("SELECT bytes, entries FROM embeddings_size").fetchone()
+        return row or (0, 0)
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        size, count = self._size(connection)
+        if size <= self.max_bytes or count == 0:
+            return
+        # drop the least recently used vectors down to 90% of the cap
+        excess = int(count * (1 - 0.9 * self.max_bytes / size)) + 1
+        connection.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+
+    def stats(self) -> dict:
+        """Hit and miss counters of this process along with the size of the cache"""
+        lookups = self.hits + self.misses
+        size, count = 0, 0
+        try:
+            with self._connect() as connection:
+                size, count = self._size(connection)
+        except sqlite3.Error as e:
+            print(f"Error: {e}")
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": count,
+            "bytes": size,
+        }
+
+
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_BYTES)
+
+
+class QueryCache:
+    """Process wide LRU cache of query embeddings"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._vectors: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._vectors.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, key: str, vector: List[float]) -> None:
+        with self._lock:
+            self._vectors[key] = vector
+            self._vectors.move_to_end(key)
+            while len(self._vectors) > self.max_entries:
+                self._vectors.popitem(last=False)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._vectors),
+        }
+
+
+query_cache = QueryCache(QUERY_CACHE_SIZE)
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings that only send texts missing from the embedding cache to the model"""
+
+    def __init__(self, embeddings: Embeddings, cache: Optional[EmbeddingCache] = None):
+        self.embeddings = embeddings
+        self.cache = cache or embedding_cache
+        self.model = model_name(embeddings)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.cache.key(self.model, text) for text in texts]
+        vectors = self.cache.get_many(keys)
+
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        if missing:
+            embedded = self.embeddings.embed_documents(list(missing.values()))
+            new_vectors = dict(zip(missing.keys(), embedded))
+            self.cache.put_many(new_vectors)
+            vectors.update(new_vectors)
+
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        """Embeds a query once per model and normalized text, repeated questions
+        and report topics are answered from the query cache
+        """
+        return self.embed_queries([text])[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embeds several queries like embed_query. Queries missing from the
+        cache are sent in a single embed_documents request when the model
+        embeds queries like documents. Models with their own query embedding
+        get one embed_query request per query, sent concurrently.
+        """
+        texts = [normalize_query(text) for text in texts]
+        # queries get their own keys, apart from the documents with the same text
+        keys = [self.cache.key(f"{self.model}:query", text) for text in texts]
+        vectors: Dict[str, List[float]] = {}
+        for key in keys:
+            vector = query_cache.get(key)
+            if vector is not None:
+                vectors[key] = vector
+
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        if missing and QUERY_CACHE_PERSIST:
+            vectors.update(self.cache.get_many(list(missing)))
+            missing = {key: text for key, text in missing.items() if key not in vectors}
+        if missing and embeds_queries_as_documents(self.embeddings):
+            embedded = dict(zip(missing, self.embeddings.embed_documents(list(missing.values()))))
+        elif missing:
+            with ThreadPoolExecutor(max_workers=min(len(missing), EMBED_CONCURRENCY)) as pool:
+                embedded = dict(
+                    zip(missing, pool.map(self.embeddings.embed_query, missing.values()))
+                )
+        if missing:
+            if QUERY_CACHE_PERSIST:
+                self.cache.put_many(embedded)
+            vectors.update(embedded)
+
+        for key in keys:
+            query_cache.put(key, vectors[key])
+        return [vectors[key] for key in keys]
@@ -0,0 +1,191 @@
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, sleep
+from typing import Callable, List, Optional, Tuple, Type
+
+from langchain.embeddings import OpenAIEmbeddings
+
+from Main.core.tokenizer import get_encoding
+
+# number of embedding requests in flight at once
+EMBED_CONCURRENCY = int(os.environ.get("EMBED_CONCURRENCY", 4))
+# tokens sent to the embedding API per minute, across every request of the process
+EMBED_TOKENS_PER_MINUTE = int(os.environ.get("EMBED_TOKENS_PER_MINUTE", 1_000_000))
+# chunks are packed into requests of at most this many tokens and inputs
+EMBED_BATCH_TOKENS = int(os.environ.get("EMBED_BATCH_TOKENS", 8191))
+EMBED_BATCH_INPUTS = 2048
+# failed requests are retried this many times before giving up
+EMBED_MAX_RETRIES = int(os.environ.get("EMBED_MAX_RETRIES", 6))
+
+EmbedBatch = Callable[[List[str]], List[List[float]]]
+
+
+def pack_batches(
+        token_counts: List[int], max_tokens: int, max_inputs: int = EMBED_BATCH_INPUTS
+) -> List[List[int]]:
+    """Groups consecutive texts into batches of at most max_tokens tokens and
+    max_inputs texts, a text longer than max_tokens gets a batch of its own.
+    Returns the indices of the texts in each batch.
+    """
+    batches: List[List[int]] = [[]]
+    size = 0
+    for i, tokens in enumerate(token_counts):
+        if batches[-1] and (size + tokens > max_tokens or len(batches[-1]) >= max_inputs):
+            batches.append([])
+            size = 0
+        batches[-1].append(i)
+        size += tokens
+    return batches if batches[0] else []
+
+
+class TokenBucket:
+    """Spreads requests over time to stay within a tokens per minute budget"""
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = tokens_per_minute
+        self.rate = tokens_per_minute / 60
+        self.tokens = float(tokens_per_minute)
+        self.updated = monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int) -> None:
+        """Blocks until tokens can be spent"""
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                now = monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait = (tokens - self.tokens) / self.rate
+            sleep(wait)
+
+
+# shared by every scheduler so concurrent ingestions respect one budget
+token_bucket = TokenBucket(EMBED_TOKENS_PER_MINUTE)
+
+
+def retryable_errors() -> Tuple[Type[Exception], ...]:
+    """OpenAI errors worth retrying, invalid requests and bad keys are not"""
+    import openai
+
+    return (
+        openai.error.RateLimitError,
+        openai.error.APIError,
+        openai.error.Timeout,
+        openai.error.APIConnectionError,
+        openai.error.ServiceUnavailableError,
+        openai.error.TryAgain,
+    )
+
+
+def openai_embed(texts: List[str], model: str, **kwargs) -> List[List[float]]:
+    """Embeds texts in a single request to the OpenAI embedding API"""
+    import openai
+
+    response = openai.Embedding.create(input=texts, model=model, **kwargs)
+    records = sorted(response["data"], key=lambda record: record["index"])
+    return [record["embedding"] for record in records]
+
+
+class EmbeddingScheduler:
+    """Embeds texts in token packed requests sent concurrently.
+
+    Requests wait on a token bucket so the process stays within its tokens
+    per minute budget, failed requests are retried with exponential backoff
+    and full jitter so concurrent requests do not retry in lockstep.
+    """
+
+    def __init__(
+            self,
+            embed_batch: EmbedBatch,
+            model_name: str = "text-embedding-ada-002",
+            concurrency: int = EMBED_CONCURRENCY,
+            max_batch_tokens: int = EMBED_BATCH_TOKENS,
+            max_retries: int = EMBED_MAX_RETRIES,
+            initial_delay: float = 1.0,
+            max_delay: float = 60.0,
+            bucket: Optional[TokenBucket] = None,
+            retry_on: Optional[Tuple[Type[Exception], ...]] = None,
+    ):
+        self.embed_batch = embed_batch
+        self.model_name = model_name
+        self.concurrency = concurrency
+        self.max_batch_tokens = max_batch_tokens
+        self.max_retries = max_retries
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.bucket = bucket or token_bucket
+        self.retry_on = retry_on or retryable_errors()
+
+    def _send(self, texts: List[str], tokens: int) -> List[List[float]]:
+        attempt = 0
+        while True:
+            self.bucket.acquire(tokens)
+            try:
+                return self.embed_batch(texts)
+            except self.retry_on as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = random.uniform(0, min(self.max_delay, self.initial_delay * 2 ** attempt))
+                print(f"Error: {e}, retrying in {delay:.1f}s")
+                sleep(delay)
+                attempt += 1
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """Returns the embedding of each text in the given order"""
+        if not texts:
+            return []
+        encoding = get_encoding(self.model_name)
+        token_counts = [len(tokens) for tokens in encoding.encode_batch(texts, disallowed_special=())]
+        batches = pack_batches(token_counts, self.max_batch_tokens)
+
+        with ThreadPoolExecutor(max_workers=max(1, self.concurrency)) as pool:
+            futures = [
+                pool.submit(
+                    self._send,
+                    [texts[i] for i in batch],
+                    sum(token_counts[i] for i in batch),
+                )
+                for batch in batches
+            ]
+            embeddings: List[List[float]] = [[] for _ in texts]
+            for batch, future in zip(batches, futures):
+                for i, embedding in zip(batch, future.result()):
+                    embeddings[i] = embedding
+        return embeddings
+
+
+class ScheduledOpenAIEmbeddings(OpenAIEmbeddings):
+    """OpenAIEmbeddings that embed documents through an EmbeddingScheduler.
+    Setting OPENAI_API_BASE points it at a local fake embedding server.
+    """
+
+    concurrency: int = EMBED_CONCURRENCY
+    max_batch_tokens: int = EMBED_BATCH_TOKENS
+    # OpenAI embeds a query like any other text, queries are batched as documents
+    queries_as_documents: bool = True
+
+    def embed_documents(self, texts: List[str], chunk_size: Optional[int] = 0) -> List[List[float]]:
+        def embed_batch(batch: List[str]) -> List[List[float]]:
+            return openai_embed(
+                batch,
+                model=self.model,
+                api_key=self.openai_api_key,
+                api_base=self.openai_api_base or None,
+                organization=self.openai_organization or None,
+                request_timeout=self.request_timeout,
+            )
+
+        scheduler = EmbeddingScheduler(
+            embed_batch,
+            model_name=self.model,
+            concurrency=self.concurrency,
+            max_batch_tokens=self.max_batch_tokens,
+            max_retries=self.max_retries,
+        )
+        return scheduler.embed(texts)
@@ -0,0 +1,177 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from typing import Callable, Iterator, List, Optional, Tuple, Union
+
+from Main.core.spooling import Buffer, BufferReader, SpooledFile
+
+# number of worker processes used to extract text from large PDFs
+PARSE_WORKERS = int(os.environ.get("PARSE_WORKERS", os.cpu_count() or 1))
+# smaller documents are extracted in process, a pool costs more than it saves.
+# Spawning the workers takes about a second against ~23 ms per mixed text and
+# table page, 4 workers break even near 64 pages, see benchmarks/parallel_extraction.py
+MIN_PARALLEL_PAGES = int(os.environ.get("MIN_PARALLEL_PAGES", 64))
+# comma separated backends in order of preference when they extract the same
+# amount of text. On generated prose pypdf is faster, on tables fitz yields
+# twice the text in half the time, see benchmarks/pdf_backends.py
+DEFAULT_BACKENDS = os.environ.get("PDF_BACKENDS", "fitz,pypdf").split(",")
+# number of pages timed by select_backends
+SAMPLE_PAGES = 3
+# a backend within this fraction of the best text yield is compared on speed
+YIELD_TOLERANCE = 0.9
+
+Source = Union[str, Buffer]
+
+
+def _open_fitz(source: Source) -> Callable[[int], str]:
+    import fitz
+
+    if isinstance(source, str):
+        pdf = fitz.open(source)
+    else:
+        pdf = fitz.open(stream=source, filetype="pdf")  # type: ignore
+    return lambda i: pdf[i].get_text(sort=True)
+
+
+def _open_pypdf(source: Source) -> Callable[[int], str]:
+    from pypdf import PdfReader
+
+    reader = PdfReader(source if isinstance(source, str) else BufferReader(source))
+    return lambda i: reader.pages[i].extract_text()
+
+
+# open a document and return a function extracting the text of a page
+OPENERS: dict[str, Callable[[Source], Callable[[int], str]]] = {
+    "fitz": _open_fitz,
+    "pypdf": _open_pypdf,
+}
+
+
+def _iter_with_fallback(
+        backends: List[str], source: Source, start: int, stop: int
+) -> Iterator[str]:
+    """Yields the text of pages [start, stop) extracted with the first backend,
+    pages a backend fails on or finds no text on are retried with the next one
+    """
+    readers: dict[str, Optional[Callable[[int], str]]] = {}
+
+    def page_text(backend: str, i: int) -> str:
+        if backend not in readers:
+            try:
+                readers[backend] = OPENERS[backend](source)
+            except Exception as e:
+                print(f"Error: {backend} cannot open document: {e}")
+                readers[backend] = None
+        if readers[backend] is None:
+            return ""
+        try:
+            return readers[backend](i) or ""
+        except Exception as e:
+            print(f"Error: {backend} failed on page {i + 1}: {e}")
+            return ""
+
+    for i in range(start, stop):
+        text = ""
+        for backend in backends:
+            text = page_text(backend, i)
+            if text.strip():
+                break
+        yield text
+
+
+def _extract_range(backends: List[str], source: Source, start: int, stop: int) -> List[str]:
+    """Worker entry point, extracts the text of pages [start, stop)"""
+    return list(_iter_with_fallback(backends, source, start, stop))
+
+
+def select_backends(
+        upload: SpooledFile,
+        page_count: int,
+        sample_pages: int = SAMPLE_PAGES,
+        backends: Optional[List[str]] = None,
+) -> List[str]:
+    """Orders the backends for a document by timing them on a few sample pages.
+
+    Backends extracting close to the most text are ranked by speed, the
+    others follow by text yield and backends that fail come last.
+    """
+    backends = backends or DEFAULT_BACKENDS
+    if page_count == 0:
+        return backends
+    step = max(1, page_count // sample_pages)
+    pages = list(range(0, page_count, step))[:sample_pages]
+
+    results = {}
+    for backend in backends:
+        try:
+            page_text = OPENERS[backend](upload.source)
+            started = perf_counter()
+            chars = sum(len(page_text(i).strip()) for i in pages)
+            results[backend] = (chars, perf_counter() - started)
+        except Exception as e:
+            print(f"Error: {backend} failed on sample pages: {e}")
+
+    if not results:
+        return backends
+    best_chars = max(chars for chars, _ in results.values())
+    if best_chars == 0:
+        return backends
+
+    def rank(backend: str) -> Tuple[int, float]:
+        if backend not in results:
+            return 2, 0.0
+        chars, seconds = results[backend]
+        if chars >= YIELD_TOLERANCE * best_chars:
+            return 0, seconds
+        return 1, -chars
+
+    return sorted(backends, key=rank)
+
+
+def page_ranges(size: int, parts: int) -> List[Tuple[int, int]]:
+    """Splits size pages into at most parts contiguous [start, stop) ranges"""
+    parts = max(1, min(parts, size))
+    step, extra = divmod(size, parts)
+    ranges = []
+    start = 0
+    for i in range(parts):
+        stop = start + step + (1 if i < extra else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def iter_texts(
+        upload: SpooledFile,
+        backends: List[str],
+        page_count: int,
+        workers: int = PARSE_WORKERS,
+) -> Iterator[str]:
+    """Yields the text of every page of a PDF in page order.
+
+    Pages are extracted with the first backend and fall back to the next
+    ones on errors or empty pages. Page ranges are split across worker
+    processes that each open the spooled upload from disk, texts are
+    yielded as soon as their range and every range before it are done.
+    The pool is skipped for small documents or when workers is 1.
+    """
+    for backend in backends:
+        if backend not in OPENERS:
+            raise NotImplementedError(f"PDF backend {backend} not supported")
+
+    if workers <= 1 or page_count < MIN_PARALLEL_PAGES:
+        yield from _iter_with_fallback(backends, upload.source, 0, page_count)
+        return
+
+    # split in more ranges than workers so the first pages come back early
+    ranges = page_ranges(page_count, workers * 4)
+    path = upload.spool_path()
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = [
+            pool.submit(_extract_range, backends, path, start, stop)
+            for start, stop in ranges
+        ]
+        for future in futures:
+            yield from future.result()
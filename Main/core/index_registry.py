@@ -0,0 +1,197 @@
+import os
+import threading
+import weakref
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+
+from Main.core.embedding import FolderIndex
+from Main.core.parsing import File
+
+# folder indexes nobody uses are evicted once the registry holds more than this
+INDEX_REGISTRY_MAX_BYTES = int(os.environ.get("INDEX_REGISTRY_MAX_BYTES", 4 * 1024 ** 3))
+
+
+def resident_size(folder_index: FolderIndex, files: List[File]) -> Dict[str, int]:
+    """Estimated memory held by a folder index and its parsed files.
+    Memory mapped IVF lists are counted apart, their pages are shared with
+    every process mapping the same saved index. Their centroids are still
+    held in memory.
+    """
+    vector_bytes = 0
+    mapped_bytes = 0
+    index = getattr(folder_index.index, "index", None)
+    if index is not None:
+        try:
+            code_bytes = index.ntotal * index.sa_code_size()
+        except RuntimeError:
+            code_bytes = index.ntotal * index.d * 4
+        config = folder_index.index_config
+        if folder_index.mapped:
+            mapped_bytes = code_bytes
+            vector_bytes = config.nlist * index.d * 4
+        else:
+            vector_bytes = code_bytes
+        if config is not None and config.kind == "hnsw":
+            # neighbor lists, about 2 * M links per vector on the base level
+            vector_bytes += index.ntotal * config.hnsw_m * 2 * 4
+
+    text_bytes = sum(
+        len(doc.page_content.encode("utf-8"))
+        for file in list(folder_index.files) + list(files)
+        for doc in file.docs
+    )
+    return {
+        "vector_bytes": vector_bytes,
+        "mapped_bytes": mapped_bytes,
+        "text_bytes": text_bytes,
+    }
+
+
+class _Entry:
+    def __init__(self, folder_index: FolderIndex, files: List[File]):
+        self.folder_index = folder_index
+        self.files = files
+        self.refs = 0
+        self.size = resident_size(folder_index, files)
+
+    @property
+    def bytes(self) -> int:
+        return self.size["vector_bytes"] + self.size["text_bytes"]
+
+
+class IndexHandle:
+    """A reference to a shared folder index, released explicitly or when
+    it is garbage collected along with the session that held it
+    """
+
+    def __init__(self, registry: "IndexRegistry", key: str, entry: _Entry):
+        self.key = key
+        self.folder_index = entry.folder_index
+        self.files = entry.files
+        self._finalizer = weakref.finalize(self, registry._release, key, entry)
+
+    @property
+    def released(self) -> bool:
+        return not self._finalizer.alive
+
+    def release(self) -> None:
+        self._finalizer()
+
+
+class IndexRegistry:
+    """Process wide registry sharing folder indexes between sessions.
+
+    Indexes are keyed by FolderIndex.key, the content hash of their folder
+    and of the parser, chunking and embedding settings. Sessions opening the
+    same files with the same settings get handles to the same FolderIndex
+    and parsed files.
+    Indexes no handle refers to are evicted least recently used first
+    once the registry is over its memory budget, they stay on disk.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        # entries of handles released by the garbage collector, see _release
+        self._released: "deque[_Entry]" = deque()
+
+    def _drain(self) -> None:
+        """Applies the queued releases, called with the lock held"""
+        while self._released:
+            self._released.popleft().refs -= 1
+
+    def _handle(self, key: str, entry: _Entry) -> IndexHandle:
+        entry.refs += 1
+        self._entries.move_to_end(key)
+        return IndexHandle(self, key, entry)
+
+    def get(self, key: str) -> Optional[IndexHandle]:
+        """A handle to the folder index of key, None if it is not loaded"""
+        with self._lock:
+            self._drain()
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self._handle(key, entry)
+
+    def register(self, key: str, folder_index: FolderIndex, files: List[File]) -> IndexHandle:
+        """Shares a folder index, if another session registered the same
+        folder first a handle to that one is returned instead
+        """
+        with self._lock:
+            self._drain()
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(folder_index, files)
+            handle = self._handle(key, entry)
+            self._evict()
+            return handle
+
+    def detach(self, handle: IndexHandle) -> Optional[FolderIndex]:
+        """Takes a folder index out of the registry so its owner can change it.
+        Returns None and releases the handle if other sessions still use it.
+        """
+        with self._lock:
+            self._drain()
+            entry = self._entries.get(handle.key)
+            if entry is not None and entry.folder_index is handle.folder_index and entry.refs > 1:
+                shared = True
+            else:
+                shared = False
+                if entry is not None and entry.folder_index is handle.folder_index:
+                    del self._entries[handle.key]
+        handle.release()
+        return None if shared else handle.folder_index
+
+    def _release(self, key: str, entry: _Entry) -> None:
+        """Finalizer of a handle. The garbage collector can run it in a thread
+        that already holds the lock, so the release is queued and only
+        applied here when the lock is free, otherwise by the next locked call.
+        """
+        self._released.append(entry)
+        if self._lock.acquire(blocking=False):
+            try:
+                self._drain()
+                self._evict()
+            finally:
+                self._lock.release()
+
+    def _evict(self) -> None:
+        size = sum(entry.bytes for entry in self._entries.values())
+        for key in list(self._entries):
+            if size <= self.max_bytes:
+                break
+            entry = self._entries[key]
+            if entry.refs > 0:
+                continue
+            del self._entries[key]
+            size -= entry.bytes
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """Resident size of the shared indexes along with lookup counters"""
+        with self._lock:
+            self._drain()
+            entries = list(self._entries.values())
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(entries),
+                "in_use": sum(1 for entry in entries if entry.refs > 0),
+                "handles": sum(entry.refs for entry in entries),
+                "resident_bytes": sum(entry.bytes for entry in entries),
+                "mapped_bytes": sum(entry.size["mapped_bytes"] for entry in entries),
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
+index_registry = IndexRegistry(INDEX_REGISTRY_MAX_BYTES)
@@ -0,0 +1,87 @@
+import json
+import os
+import shutil
+import tempfile
+from hashlib import md5
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# where folder indexes are saved, point it at a shared volume to share them between replicas
+INDEX_DIR = os.environ.get(
+    "INDEX_DIR", os.path.join(tempfile.gettempdir(), "deck_summarizer", "indexes")
+)
+# least recently opened indexes are removed once the directory grows past this size
+INDEX_MAX_BYTES = int(os.environ.get("INDEX_MAX_BYTES", 8 * 1024 ** 3))
+
+# files making up a saved folder index
+VECTORS_FILE = "index.faiss"
+STORE_FILE = "store.pkl"
+MANIFEST_FILE = "manifest.json"
+
+
+def folder_hash(file_ids: Iterable[str], settings: Optional[Dict[str, Any]] = None) -> str:
+    """Content hash of a folder, the same for any order of its files.
+    settings are what its chunks and vectors depend on besides the files,
+    see Main.core.embedding.index_settings, other settings give another hash.
+    """
+    content = "\n".join(sorted(set(file_ids)))
+    if settings:
+        content += "\n" + json.dumps(settings, sort_keys=True)
+    return md5(content.encode("utf-8")).hexdigest()
+
+
+def index_path(key: str, directory: str = INDEX_DIR) -> str:
+    return os.path.join(directory, key)
+
+
+def find_index(key: str, directory: str = INDEX_DIR) -> Optional[str]:
+    """Path of a saved index, None if there is none.
+    Its modification time is bumped so eviction drops the least recently used ones.
+    """
+    path = index_path(key, directory)
+    if not os.path.exists(os.path.join(path, MANIFEST_FILE)):
+        return None
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+    return path
+
+
+def publish_index(tmp_path: str, key: str, directory: str = INDEX_DIR) -> str:
+    """Moves a fully written index directory in place, readers never see a partial index"""
+    path = index_path(key, directory)
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # another process saved the same folder first, both have the same content
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    evict_indexes(directory)
+    return path
+
+
+def _indexes(directory: str) -> List[Tuple[str, float, int]]:
+    """(path, modification time, size) of every saved index"""
+    indexes = []
+    try:
+        for entry in os.scandir(directory):
+            if entry.is_dir() and not entry.name.startswith("."):
+                size = 0
+                for file in os.scandir(entry.path):
+                    size += file.stat().st_size
+                indexes.append((entry.path, entry.stat().st_mtime, size))
+    except OSError:
+        pass
+    return indexes
+
+
+def evict_indexes(directory: str = INDEX_DIR, max_bytes: int = INDEX_MAX_BYTES) -> None:
+    """Removes the least recently used indexes until the directory fits in max_bytes.
+    Processes that memory mapped a removed index keep reading it until they close it.
+    """
+    indexes = sorted(_indexes(directory), key=lambda index: index[1])
+    size = sum(index_size for _, _, index_size in indexes)
+    for path, _, index_size in indexes:
+        if size <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        size -= index_size
@@ -0,0 +1,199 @@
+import math
+import os
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+
+# below this many vectors an exact flat index is fast enough
+FLAT_MAX_VECTORS = int(os.environ.get("FLAT_MAX_VECTORS", 50_000))
+# trade-off for large corpora: "recall", "balanced" or "latency"
+INDEX_TARGET = os.environ.get("INDEX_TARGET", "balanced")
+# vector storage for large corpora: "float32", "float16" or "pq"
+INDEX_STORAGE = os.environ.get("INDEX_STORAGE", "float32")
+
+TARGETS = ["recall", "balanced", "latency"]
+STORAGES = ["float32", "float16", "pq"]
+# IVF lists probed per query for each target
+IVF_NPROBE = {"recall": 64, "balanced": 32, "latency": 8}
+# HNSW candidates explored per query for each target
+HNSW_EF_SEARCH = {"recall": 128, "balanced": 64, "latency": 32}
+HNSW_M = 32
+# hnsw cannot remove vectors, it is rebuilt once this share of its vectors was removed
+HNSW_MAX_DELETED = float(os.environ.get("HNSW_MAX_DELETED", 0.2))
+# at most this many vectors are used to train IVF and PQ indexes
+MAX_TRAINING_VECTORS = 256 * 1024
+
+
+class IndexConfig(NamedTuple):
+    """How the vectors of a folder are indexed, enough to rebuild the same index"""
+
+    kind: str  # "flat", "hnsw" or "ivf"
+    target: str = INDEX_TARGET
+    # flat indexes keep pq storage as float32, there is too little to train on
+    storage: str = "float32"
+    nlist: int = 0
+    nprobe: int = 0
+    hnsw_m: int = 0
+    ef_search: int = 0
+    pq_m: int = 0
+
+
+def _pq_subquantizers(dim: int) -> int:
+    """Largest number of PQ sub-quantizers of at least 16 dimensions dividing dim"""
+    for m in (96, 64, 48, 32, 24, 16, 8, 4, 2, 1):
+        if dim % m == 0 and dim // m >= 16:
+            return m
+    return 1
+
+
+def choose_index_config(
+        num_vectors: int,
+        dim: int,
+        target: str = INDEX_TARGET,
+        storage: str = INDEX_STORAGE,
+) -> IndexConfig:
+    """Picks an index type from the corpus size and a latency/recall target.
+
+    Small corpora get an exact flat index. Large ones get an approximate
+    index: HNSW unless latency is preferred, IVF for latency or PQ storage
+    as PQ codes need the IVF lists to be searched quickly.
+    """
+    if target not in TARGETS:
+        raise NotImplementedError(f"Index target {target} not supported.")
+    if storage not in STORAGES:
+        raise NotImplementedError(f"Index storage {storage} not supported.")
+
+    if num_vectors < FLAT_MAX_VECTORS:
+        return IndexConfig("flat", target=target, storage=storage)
+
+    if storage != "pq" and target != "latency":
+        return IndexConfig(
+            "hnsw",
+            target=target,
+            storage=storage,
+            hnsw_m=HNSW_M,
+            ef_search=HNSW_EF_SEARCH[target],
+        )
+
+    # about 4 * sqrt(n) lists, rounded to a power of two
+    nlist = 2 ** round(math.log2(4 * math.sqrt(num_vectors)))
+    return IndexConfig(
+        "ivf",
+        target=target,
+        storage=storage,
+        nlist=nlist,
+        nprobe=min(nlist, IVF_NPROBE[target]),
+        pq_m=_pq_subquantizers(dim) if storage == "pq" else 0,
+    )
+
+
+def build_index(config: IndexConfig, vectors: np.ndarray):
+    """Creates a faiss index for a config, trained and filled with vectors"""
+    import faiss
+
+    dim = vectors.shape[1]
+    if config.kind == "flat":
+        index = faiss.index_factory(dim, "SQfp16" if config.storage == "float16" else "Flat")
+    elif config.kind == "hnsw":
+        if config.storage == "float16":
+            index = faiss.IndexHNSWSQ(dim, faiss.ScalarQuantizer.QT_fp16, config.hnsw_m)
+        else:
+            index = faiss.IndexHNSWFlat(dim, config.hnsw_m)
+        index.hnsw.efSearch = config.ef_search
+    elif config.kind == "ivf":
+        codes = {"float32": "Flat", "float16": "SQfp16", "pq": f"PQ{config.pq_m}"}
+        index = faiss.index_factory(dim, f"IVF{config.nlist},{codes[config.storage]}")
+        index.nprobe = config.nprobe
+    else:
+        raise NotImplementedError(f"Index kind {config.kind} not supported.")
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if not index.is_trained:
+        sample = vectors
+        if len(vectors) > MAX_TRAINING_VECTORS:
+            rows = np.random.RandomState(1).choice(len(vectors), MAX_TRAINING_VECTORS, replace=False)
+            sample = vectors[rows]
+        index.train(sample)
+    if len(vectors):
+        index.add(vectors)
+    return index
+
+
+def _ivf(index):
+    """The IVF index inside an index, None for other types"""
+    import faiss
+
+    try:
+        return faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return None
+
+
+def _direct_map(index) -> None:
+    """IVF indexes can only reconstruct vectors once they have a direct map,
+    a hash table as their labels have gaps once vectors are removed
+    """
+    import faiss
+
+    ivf = _ivf(index)
+    if ivf is not None and ivf.direct_map.type != faiss.DirectMap.Hashtable:
+        ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+
+
+def add_vectors(index, vectors: np.ndarray, first_label: int) -> List[int]:
+    """Adds vectors to a faiss index and returns their labels. IVF indexes
+    take the labels from first_label on, other indexes label vectors in
+    the order they were added.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if _ivf(index) is None:
+        labels = list(range(index.ntotal, index.ntotal + len(vectors)))
+        index.add(vectors)
+        return labels
+    _direct_map(index)
+    labels = list(range(first_label, first_label + len(vectors)))
+    index.add_with_ids(vectors, np.array(labels, dtype=np.int64))
+    return labels
+
+
+def remove_vectors(index, labels: List[int]) -> None:
+    """Removes vectors from an IVF index in place, the other labels stay the same"""
+    import faiss
+
+    _direct_map(index)
+    labels = np.array(labels, dtype=np.int64)
+    # the hash table direct map only removes labels given as an array
+    index.remove_ids(faiss.IDSelectorArray(len(labels), faiss.swig_ptr(labels)))
+
+
+def is_memory_mapped(index) -> bool:
+    """Whether an index reads its vectors from a memory mapped file.
+    faiss only maps the inverted lists of IVF indexes, flat and HNSW
+    indexes are read into memory whatever the IO flags.
+    """
+    import faiss
+
+    ivf = _ivf(index)
+    if ivf is None:
+        return False
+    return isinstance(faiss.downcast_InvertedLists(ivf.invlists), faiss.OnDiskInvertedLists)
+
+
+def reconstruct(index, labels: List[int]) -> np.ndarray:
+    """Vectors of some labels of a faiss index"""
+    _direct_map(index)
+    if not labels:
+        return np.zeros((0, index.d), dtype=np.float32)
+    return np.vstack([index.reconstruct(int(i)) for i in labels])
+
+
+def index_vectors(index, labels: Optional[List[int]] = None) -> np.ndarray:
+    """Vectors held by a faiss index in the order of labels, all of them by
+    default, approximate for compressed storage
+    """
+    if labels is not None and labels != list(range(index.ntotal)):
+        return reconstruct(index, labels)
+    _direct_map(index)
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    return index.reconstruct_n(0, index.ntotal)
@@ -0,0 +1,191 @@
+import threading
+from io import BytesIO
+from typing import List, Optional
+
+from Main.core.chunking import iter_chunk_batches
+from Main.core.embedding import FolderIndex, get_embeddings, get_vector_store, index_settings
+from Main.core.parsing import File, stream_file
+from Main.core.index_registry import IndexHandle, index_registry
+from Main.core.index_store import folder_hash
+from Main.core.spooling import SpooledFile
+
+
+class Ingestion:
+    """Parses, chunks and indexes uploaded files in a background thread.
+
+    Pages are indexed batch by batch as they are parsed, so the folder index
+    can be queried as soon as the first batch is in while the rest loads.
+    Given the previous ingestion, its folder index is updated in place:
+    files that are no longer uploaded are removed and only new files are parsed.
+    A folder that was indexed before is loaded from disk instead, and the
+    folder index is saved once every file is in. Finished folder indexes are
+    shared with other sessions through the index registry.
+    The thread never touches the Streamlit session, the script reads its
+    counters to draw progress.
+    """
+
+    def __init__(
+            self,
+            uploaded_files: List[BytesIO],
+            embedding: str,
+            vector_store: str,
+            chunk_size: int,
+            chunk_overlap: int = 0,
+            ocr_enabled: bool = False,
+            previous: Optional["Ingestion"] = None,
+            **kwargs,
+    ):
+        self.uploaded_files = uploaded_files
+        self.embeddings = get_embeddings(embedding, **kwargs)
+        self.vector_store = get_vector_store(vector_store)
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.ocr_enabled = ocr_enabled
+        # part of the folder key, a folder indexed with other settings is indexed again
+        self.settings = index_settings(self.embeddings, chunk_size, chunk_overlap, ocr_enabled)
+
+        self.files: List[File] = []
+        self.chunked_files: List[File] = []
+        self.folder_index: Optional[FolderIndex] = None
+        self.errors: List[Exception] = []
+        self.files_done = 0
+        # fraction of the file being parsed and what is being done to it
+        self.file_progress = 0.0
+        self.stage = ""
+        self.pages_indexed = 0
+        self.done = False
+        # reference to the folder index in the process wide registry, once shared
+        self.handle: Optional[IndexHandle] = None
+        self._previous = previous
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> "Ingestion":
+        self._thread.start()
+        return self
+
+    @property
+    def progress(self) -> float:
+        """Fraction of the uploaded files that are indexed"""
+        if not self.uploaded_files:
+            return 1.0
+        return min(1.0, (self.files_done + self.file_progress) / len(self.uploaded_files))
+
+    def _report(self, progress: float, stage: str) -> None:
+        """Progress callback of the parsers"""
+        self.file_progress = progress
+        self.stage = stage
+
+    def _reuse(self, previous: "Ingestion", file_ids: List[str]) -> None:
+        """Takes over the folder index of a finished ingestion,
+        dropping the files that are not uploaded anymore.
+        A folder index other sessions share is not changed, a private copy
+        is loaded from disk instead.
+        """
+        folder_index = previous.folder_index
+        if previous.handle is not None:
+            folder_index = index_registry.detach(previous.handle)
+            if folder_index is None:
+                folder_index = FolderIndex.load(previous.handle.key, self.embeddings)
+        if folder_index is None:
+            return
+        kept = set(file_ids)
+        folder_index.remove_files([f.id for f in folder_index.files if f.id not in kept])
+        self.files = [f for f in previous.files if f.id in kept]
+        self.chunked_files = list(folder_index.files)
+        self.folder_index = folder_index
+
+    def _share(self, handle: IndexHandle) -> None:
+        """Uses a folder index another session already indexed"""
+        self.handle = handle
+        self.folder_index = handle.folder_index
+        self.files = list(handle.files)
+        self.chunked_files = list(handle.folder_index.files)
+
+    def _run(self) -> None:
+        # every upload is read and hashed once, the parsers reuse the spooled copy
+        uploads: List[SpooledFile] = []
+        try:
+            for uploaded_file in self.uploaded_files:
+                uploads.append(SpooledFile.from_upload(uploaded_file))
+            file_ids = [upload.id for upload in uploads]
+            previous, self._previous = self._previous, None
+            if previous is not None and previous.done and previous.settings == self.settings:
+                try:
+                    self._reuse(previous, file_ids)
+                except Exception as e:
+                    # index every file again rather than use a half updated folder
+                    self.errors.append(e)
+                    self.folder_index = None
+                    self.files = []
+                    self.chunked_files = []
+            if self.folder_index is None:
+                key = folder_hash(file_ids, self.settings)
+                handle = index_registry.get(key)
+                if handle is not None:
+                    self._share(handle)
+                    self.files_done = len(self.uploaded_files)
+                    return
+                self.folder_index = FolderIndex.load(key, self.embeddings)
+
+            for upload in uploads:
+                try:
+                    if self.folder_index is None or not self.folder_index.has_file(upload.id):
+                        self._ingest(upload)
+                    elif all(f.id != upload.id for f in self.files):
+                        self._restore(upload)
+                except Exception as e:
+                    self.errors.append(e)
+                self.files_done += 1
+                self.file_progress = 0.0
+
+            if self.folder_index is not None and not self.errors:
+                # the folder may have outgrown the index type picked for its first batch
+                self.folder_index.optimize()
+                self.folder_index.save()
+                # share the folder with other sessions opening the same files
+                self._share(index_registry.register(
+                    self.folder_index.key, self.folder_index, self.files
+                ))
+        finally:
+            for upload in uploads:
+                upload.close()
+            self.done = True
+
+    def _restore(self, upload: SpooledFile) -> None:
+        """Picks up a file of a folder index loaded from disk, the parsed file
+        comes from the parse cache and its chunks from the folder index
+        """
+        file, batches = stream_file(
+            upload, ocr_enabled=self.ocr_enabled, progress=self._report
+        )
+        for _ in batches:
+            pass
+        self.files.append(file)
+        self.chunked_files.append(
+            next(f for f in self.folder_index.files if f.id == upload.id)
+        )
+
+    def _ingest(self, upload: SpooledFile) -> None:
+        file, batches = stream_file(
+            upload, ocr_enabled=self.ocr_enabled, progress=self._report
+        )
+        chunked_file = file.copy()
+        self.files.append(file)
+        self.chunked_files.append(chunked_file)
+
+        # large files are chunked in worker processes while the next pages are parsed
+        for docs, chunks in iter_chunk_batches(
+                batches, chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap
+        ):
+            if chunks and self.folder_index is None:
+                chunked_file.docs.extend(chunks)
+                self.folder_index = FolderIndex.from_files(
+                    files=[chunked_file],
+                    embeddings=self.embeddings,
+                    vector_store=self.vector_store,
+                    settings=self.settings,
+                )
+            elif chunks:
+                self.folder_index.add_docs(chunked_file, chunks)
+            self.pages_indexed += len(docs)
@@ -0,0 +1,114 @@
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import md5
+from time import monotonic, sleep
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import requests
+
+from Main.core.PDF_Parser import parse_img, fetch_text
+from Main.core.parse_cache import ParseCache
+
+# number of requests in flight against the OCR service at once
+OCR_MAX_WORKERS = int(os.environ.get("OCR_MAX_WORKERS", 8))
+# give up on images that are not done after this many seconds
+OCR_TIMEOUT = float(os.environ.get("OCR_TIMEOUT", 300))
+# OCR results are cached on disk by the hash of the image bytes
+OCR_CACHE_DIR = os.environ.get(
+    "OCR_CACHE_DIR", os.path.join(tempfile.gettempdir(), "deck_summarizer", "ocr_cache")
+)
+OCR_CACHE_MAX_BYTES = int(os.environ.get("OCR_CACHE_MAX_BYTES", 256 * 1024 ** 2))
+
+ocr_cache = ParseCache(OCR_CACHE_DIR, OCR_CACHE_MAX_BYTES)
+
+
+class OCRImage(NamedTuple):
+    """An image waiting to be OCR'd, page is the index of the doc it belongs to"""
+
+    page: int
+    name: str
+    data: bytes
+
+
+# lines wrapping the OCR'd text of an image on a page
+IMG_DATA_START = "----- img_data -----"
+IMG_DATA_END = "----- end -----"
+
+
+def format_img_text(text: str) -> str:
+    """Wraps OCR'd text the way it is appended to a page"""
+    return f" {IMG_DATA_START} \n {text} \n {IMG_DATA_END} "
+
+
+def _submit(image: OCRImage) -> Optional[dict]:
+    try:
+        return parse_img(image.name, image.data)
+    except requests.RequestException as e:
+        print(f"Error: {e}")
+        return None
+
+
+def _poll(uid: str) -> Optional[dict]:
+    try:
+        return fetch_text(uid)
+    except requests.RequestException as e:
+        print(f"Error: {e}")
+        return None
+
+
+def run_ocr(
+        images: List[OCRImage],
+        max_workers: int = OCR_MAX_WORKERS,
+        timeout: float = OCR_TIMEOUT,
+        initial_delay: float = 0.5,
+        max_delay: float = 8.0,
+        progress: Optional[Callable[[float], None]] = None,
+) -> List[Optional[str]]:
+    """Submits images to the OCR service concurrently and polls for the results.
+
+    Images are deduplicated by content hash, so repeated logos and banners
+    are only OCR'd once, and images found in the OCR cache are not sent at all.
+    Polling backs off exponentially while nothing completes and resets to
+    initial_delay as soon as results start coming in.
+    Returns the text of each image in the given order, None for images that
+    failed or did not complete before the timeout.
+    """
+    keys = [md5(image.data).hexdigest() for image in images]
+    texts: Dict[str, str] = {}
+    unique: Dict[str, OCRImage] = {}
+    for key, image in zip(keys, images):
+        if key in texts or key in unique:
+            continue
+        cached = ocr_cache.get(key)
+        if cached is not None:
+            texts[key] = cached["text"]
+        else:
+            unique[key] = image
+
+    if unique:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            responses = pool.map(_submit, unique.values())
+            pending = {
+                response["uid"]: key
+                for key, response in zip(unique, responses) if response
+            }
+            total = len(pending)
+            deadline = monotonic() + timeout
+            delay = initial_delay
+            while pending and monotonic() < deadline:
+                sleep(delay)
+                uids = list(pending)
+                completed = 0
+                for uid, response in zip(uids, pool.map(_poll, uids)):
+                    if response and response.get("completed"):
+                        key = pending.pop(uid)
+                        texts[key] = response["document_text"]
+                        ocr_cache.put(key, {"text": texts[key]})
+                        completed += 1
+                delay = initial_delay if completed else min(delay * 2, max_delay)
+
+                if progress:
+                    progress((total - len(pending)) / total)
+
+    return [texts.get(key) for key in keys]
@@ -0,0 +1,118 @@
+import json
+import os
+import tempfile
+import threading
+from typing import Optional
+
+# where parsed files are kept, point it at a shared volume to share it between replicas
+PARSE_CACHE_DIR = os.environ.get(
+    "PARSE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "deck_summarizer", "parse_cache")
+)
+# least recently used entries are evicted once the cache grows past this size
+PARSE_CACHE_MAX_BYTES = int(os.environ.get("PARSE_CACHE_MAX_BYTES", 1024 ** 3))
+
+
+class ParseCache:
+    """Content addressed cache of parsed files on local disk.
+
+    Entries are JSON files named after their key, their modification time
+    is bumped on every hit so eviction drops the least recently used ones.
+    The size of the cache is read from disk once and then kept up to date by
+    put, the directory is only scanned again when the cap is crossed.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # bytes in the cache, None until the directory was scanned
+        self._size: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[dict]:
+        """Returns the cached entry for key, None on a miss"""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, key: str, data: dict) -> None:
+        """Stores an entry and evicts old ones if the cache is over its size cap"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        # write to a temp file first so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            written = os.path.getsize(tmp_path)
+            replaced = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+
+        with self._lock:
+            if self._size is None:
+                self._size = sum(entry_size for _, _, entry_size in self._entries())
+            else:
+                self._size += written - replaced
+            full = self._size > self.max_bytes
+        if full:
+            self.evict()
+
+    def _entries(self) -> list[tuple[str, float, int]]:
+        """(path, modification time, size) of every entry"""
+        entries = []
+        try:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith(".json"):
+                    stat = entry.stat()
+                    entries.append((entry.path, stat.st_mtime, stat.st_size))
+        except OSError:
+            pass
+        return entries
+
+    def evict(self) -> None:
+        """Removes the least recently used entries until the cache fits in max_bytes.
+        Scans the directory, which also counts entries written by other processes.
+        """
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda entry: entry[1])
+            size = sum(entry_size for _, _, entry_size in entries)
+            for path, _, entry_size in entries:
+                if size <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    size -= entry_size
+                except OSError:
+                    pass
+            self._size = size
+
+    def stats(self) -> dict:
+        """Hit and miss counters of this process along with the size of the cache"""
+        entries = self._entries()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(entries),
+            "bytes": sum(entry_size for _, _, entry_size in entries),
+        }
+
+
+parse_cache = ParseCache(PARSE_CACHE_DIR, PARSE_CACHE_MAX_BYTES)
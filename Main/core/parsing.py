@@ -1,29 +1,42 @@
+import codecs
+import os
 import uuid
 from io import BytesIO
-from time import sleep
-from typing import List, Any, Optional
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, Type, Union
 import re
 
-import pandas as pd
-import streamlit as st
-from pypdf import PdfReader
-from pptx import Presentation
-
-import docx2txt
 from langchain.docstore.document import Document
-import fitz
-from hashlib import md5
 
 from abc import abstractmethod, ABC
 from copy import deepcopy
 
-from Main.core.PDF_Parser import parse_img, fetch_text
-from Main.core.WebScrapper import run_spider
+from Main.core.boilerplate import SAMPLE_PAGES, find_boilerplate, strip_boilerplate
+from Main.core.extraction import iter_texts, select_backends
+from Main.core.ocr import OCRImage, run_ocr, format_img_text
+from Main.core.parse_cache import parse_cache
+from Main.core.spooling import SpooledFile
+from Main.core.triage import PageImage, triage_page
+
+
+# number of pages parsed before they are handed to the caller when streaming
+STREAM_BATCH_SIZE = 8
+# bump whenever a parser changes its output so stale cache entries are ignored
+PARSER_VERSION = "9"
+
+# reports the fraction of a file that is parsed along with what is being done
+Progress = Callable[[float, str], None]
+
+# File subclasses by lower case extension and by MIME type, see register_parser
+PARSERS_BY_EXTENSION: dict[str, Type["File"]] = {}
+PARSERS_BY_MIME_TYPE: dict[str, Type["File"]] = {}
 
 
 class File(ABC):
     """Represents an uploaded file comprised of Documents"""
 
+    # whether headers and footers repeated across pages are removed after parsing
+    STRIP_BOILERPLATE = False
+
     def __init__(
             self,
             name: str,
@@ -39,11 +52,32 @@ class File(ABC):
     @classmethod
     def from_bytes(cls, file: BytesIO) -> "File":
         """Creates a File from a BytesIO object"""
+        with SpooledFile.from_upload(file) as upload:
+            return cls.from_upload(upload)
+
+    @classmethod
+    def from_upload(cls, upload: SpooledFile) -> "File":
+        """Creates a File from a spooled upload"""
         return None
     @classmethod
     def from_url(cls, url: str) -> "File":
         """Creates a File from a BytesIO object"""
         return None
+
+    @classmethod
+    def iter_docs(
+            cls,
+            upload: SpooledFile,
+            batch_size: Optional[int] = STREAM_BATCH_SIZE,
+            ocr_enabled: bool = False,
+            progress: Optional[Progress] = None,
+    ) -> Iterator[List[Document]]:
+        """Yields the Documents of a spooled upload in batches as they are parsed,
+        batch_size is a number of pages and None means a single batch.
+        Images are only OCR'd when ocr_enabled, progress is called as pages are parsed.
+        """
+        yield cls.from_upload(upload).docs
+
     def __repr__(self) -> str:
         return (
             f"File(name={self.name}, id={self.id},"
@@ -53,6 +87,28 @@ class File(ABC):
     def __str__(self) -> str:
         return f"File(name={self.name}, id={self.id}, metadata={self.metadata})"
 
+    def to_dict(self) -> dict:
+        """Serializes the File and its docs into a JSON compatible dict"""
+        return {
+            "name": self.name,
+            "id": self.id,
+            "metadata": self.metadata,
+            "docs": [
+                {"page_content": doc.page_content, "metadata": doc.metadata}
+                for doc in self.docs
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "File":
+        """Creates a File from the output of to_dict"""
+        return cls(
+            name=data["name"],
+            id=data["id"],
+            metadata=data["metadata"],
+            docs=[Document(**doc) for doc in data["docs"]],
+        )
+
     def copy(self) -> "File":
         """Create a deep copy of this File"""
         return self.__class__(
@@ -70,186 +126,694 @@ def strip_consecutive_newlines(text: str) -> str:
     return re.sub(r"\s*\n\s*", "\n", text)
 
 
+def batch_docs(
+        docs: Iterator[Document], batch_size: Optional[int]
+) -> Iterator[List[Document]]:
+    """Numbers documents as consecutive pages and groups them in batches,
+    for file types without pages of their own
+    """
+    batch = []
+    for page, doc in enumerate(docs, start=1):
+        doc.metadata["page"] = page
+        batch.append(doc)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+class DocxBlock(NamedTuple):
+    """A heading, paragraph or table row of a Word document"""
+
+    kind: str
+    text: str = ""
+    level: int = 0
+    page: int = 1
+
+
+def _docx_heading_level(paragraph) -> Optional[int]:
+    """Heading level of a paragraph from its style or outline level, None for body text"""
+    properties = paragraph.find(f"{W}pPr")
+    if properties is None:
+        return None
+    style = properties.find(f"{W}pStyle")
+    if style is not None:
+        name = style.get(f"{W}val", "")
+        if name.lower() == "title":
+            return 0
+        match = re.match(r"(?i)heading\s*(\d)", name)
+        if match:
+            return int(match.group(1))
+    outline = properties.find(f"{W}outlineLvl")
+    if outline is not None and outline.get(f"{W}val", "9").isdigit():
+        level = int(outline.get(f"{W}val", "9"))
+        # level 9 is body text
+        return level + 1 if level < 9 else None
+    return None
+
+
+def iter_docx_blocks(xml: BinaryIO) -> Iterator[DocxBlock]:
+    """Streams the body of word/document.xml as headings, paragraphs and table rows.
+
+    Elements are cleared as soon as they are handled so memory stays
+    bounded on very long documents. Pages are approximated from the page
+    breaks Word rendered when the document was last saved.
+    """
+    from xml.etree.ElementTree import iterparse
+
+    page = 1
+    body = None
+    depth = 0
+    tables = 0
+    # paragraphs in text boxes are part of the paragraph holding the box
+    text_boxes = 0
+    for event, element in iterparse(xml, events=("start", "end")):
+        if event == "start":
+            depth += 1
+            if element.tag == f"{W}body":
+                body = element
+            elif element.tag == f"{W}txbxContent":
+                text_boxes += 1
+            elif element.tag == f"{W}tbl":
+                tables += 1
+                if tables == 1:
+                    yield DocxBlock("table_start", page=page)
+            continue
+        depth -= 1
+
+        if element.tag == f"{W}lastRenderedPageBreak" or (
+                element.tag == f"{W}br" and element.get(f"{W}type") == "page"
+        ):
+            page += 1
+        elif element.tag == f"{W}txbxContent":
+            text_boxes -= 1
+        elif element.tag == f"{W}p" and tables == 0 and text_boxes == 0:
+            text = _docx_text(element).strip()
+            if text:
+                level = _docx_heading_level(element)
+                if level is None:
+                    yield DocxBlock("paragraph", text, page=page)
+                else:
+                    yield DocxBlock("heading", text, level, page)
+        elif element.tag == f"{W}tr" and tables == 1:
+            cells = [
+                " ".join(_docx_text(cell).split())
+                for cell in element.findall(f"{W}tc")
+            ]
+            if any(cells):
+                yield DocxBlock("row", " | ".join(cells), page=page)
+            element.clear()
+        elif element.tag == f"{W}tbl":
+            tables -= 1
+            if tables == 0:
+                yield DocxBlock("table_end", page=page)
+
+        # body children are fully handled once they end
+        if body is not None and depth == 2:
+            body.clear()
+
+
+def _docx_text(element) -> str:
+    """Text of a paragraph or table cell, with tabs and line breaks"""
+    parts = []
+    for node in element.iter():
+        if node.tag == f"{W}t":
+            parts.append(node.text or "")
+        elif node.tag == f"{W}tab":
+            parts.append("\t")
+        elif node.tag in (f"{W}br", f"{W}cr"):
+            parts.append("\n")
+        elif node.tag == f"{W}p" and parts:
+            parts.append("\n")
+    return "".join(parts)
+
+
+def register_parser(extension: str, mime_type: str):
+    """Registers a File subclass as the parser of an extension and MIME type.
+
+    Parsers import their dependencies when they are first used, so importing
+    this module stays cheap whatever file types end up being uploaded.
+    """
+
+    def register(cls: Type["File"]) -> Type["File"]:
+        PARSERS_BY_EXTENSION[extension] = cls
+        PARSERS_BY_MIME_TYPE[mime_type] = cls
+        return cls
+
+    return register
+
+
+@register_parser(
+    ".docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+)
 class DocxFile(File):
+    # sections longer than this are split into several documents
+    SECTION_MAX_CHARS = 20_000
+    # number of table rows in each document, the header row is repeated in every one
+    ROWS_PER_DOC = 50
+
+    @classmethod
+    def iter_docs(
+            cls,
+            upload: SpooledFile,
+            batch_size: Optional[int] = STREAM_BATCH_SIZE,
+            ocr_enabled: bool = False,
+            progress: Optional[Progress] = None,
+    ) -> Iterator[List[Document]]:
+        import zipfile
+
+        with upload.open() as file, zipfile.ZipFile(file) as archive:
+            with archive.open("word/document.xml") as xml:
+                yield from batch_docs(cls._iter_section_docs(xml), batch_size)
+
     @classmethod
-    def from_bytes(cls, file: BytesIO) -> "DocxFile":
-        text = docx2txt.process(file)
+    def _iter_section_docs(cls, xml: BinaryIO) -> Iterator[Document]:
+        """Groups the blocks of a document into one document per heading,
+        with tables split into row blocks
+        """
+        section = {"section": "", "heading_level": 0, "approx_page": 1}
+        paragraphs: List[str] = []
+        length = 0
+        rows: List[str] = []
+        first_row = 2
+        table = 0
+
+        def section_doc() -> Document:
+            text = strip_consecutive_newlines("\n".join(paragraphs)).strip()
+            return Document(page_content=text, metadata=dict(section))
+
+        def table_doc() -> Document:
+            text = "\n".join([section["section"], *rows]).strip()
+            # rows are numbered from the header, a table may hold nothing else
+            span = f"{first_row}-{first_row + len(rows) - 2}" if len(rows) > 1 else "1-1"
+            metadata = {**section, "table": table, "rows": span}
+            return Document(page_content=text, metadata=metadata)
+
+        for block in iter_docx_blocks(xml):
+            if block.kind == "heading":
+                if paragraphs:
+                    yield section_doc()
+                section = {
+                    "section": block.text,
+                    "heading_level": block.level,
+                    "approx_page": block.page,
+                }
+                paragraphs = [block.text]
+                length = len(block.text)
+            elif block.kind == "paragraph":
+                paragraphs.append(block.text)
+                length += len(block.text)
+                if length > cls.SECTION_MAX_CHARS:
+                    yield section_doc()
+                    paragraphs = []
+                    length = 0
+            elif block.kind == "table_start":
+                # keep the text before the table ahead of it
+                if paragraphs:
+                    yield section_doc()
+                    paragraphs = []
+                    length = 0
+                table += 1
+                rows = []
+                first_row = 2
+            elif block.kind == "row":
+                rows.append(block.text)
+                if len(rows) == cls.ROWS_PER_DOC + 1:
+                    yield table_doc()
+                    first_row += cls.ROWS_PER_DOC
+                    # repeat the header row
+                    rows = [rows[0]]
+            elif block.kind == "table_end" and rows:
+                if len(rows) > 1 or first_row == 2:
+                    yield table_doc()
+                rows = []
+        if paragraphs:
+            yield section_doc()
+
+    @classmethod
+    def from_upload(cls, upload: SpooledFile) -> "DocxFile":
+        docs = [doc for batch in cls.iter_docs(upload, batch_size=None) for doc in batch]
+        return cls(name=upload.name, id=upload.id, docs=docs)
+
+
+def append_ocr_text(
+        docs: List[Document], images: List[OCRImage], progress: Optional[Progress] = None
+) -> None:
+    """OCRs the images of a file and appends their text to the page they came from"""
+    texts = run_ocr(
+        images, progress=(lambda done: progress(done, "Decoding Images")) if progress else None
+    )
+    for image, text in zip(images, texts):
+        if text is not None:
+            docs[image.page].page_content += format_img_text(text)
+
+
+def iter_pdf_batches(
+        texts: Iterator[str],
+        page_images: Callable[[int], List[PageImage]],
+        size: int,
+        batch_size: Optional[int],
+        ocr_enabled: bool = False,
+        progress: Optional[Progress] = None,
+) -> Iterator[List[Document]]:
+    """Turns extracted page texts into page Documents, yielding them in
+    batches of batch_size pages once the images of the batch are OCR'd.
+    Only images picked by triage_page are OCR'd, the decision is recorded
+    in the "ocr" metadata of each page.
+    """
+    batch_size = batch_size or size
+    docs = []
+    images = []
+    for i, text in enumerate(texts):
         text = strip_consecutive_newlines(text)
         doc = Document(page_content=text.strip())
-        return cls(name=file.name, id=md5(file.read()).hexdigest(), docs=[doc])
+        doc.metadata["page"] = i + 1
+        if ocr_enabled:
+            selected, doc.metadata["ocr"] = triage_page(text, page_images(i))
+            for image in selected:
+                images.append(OCRImage(len(docs), image.name, image.data))
+        docs.append(doc)
+        if progress is not None:
+            progress((i + 1) / size, "Parsing PDF")
+
+        if len(docs) == batch_size or i == size - 1:
+            # retrieve images
+            append_ocr_text(docs, images, progress)
+            yield docs
+            docs = []
+            images = []
+
+
+@register_parser(".pdf", "application/pdf")
+class PdfFile(File):
+    STRIP_BOILERPLATE = True
 
+    @classmethod
+    def iter_docs(
+            cls,
+            upload: SpooledFile,
+            batch_size: Optional[int] = STREAM_BATCH_SIZE,
+            ocr_enabled: bool = False,
+            progress: Optional[Progress] = None,
+    ) -> Iterator[List[Document]]:
+        from pypdf import PdfReader
+        from pypdf.errors import PyPdfError
+
+        with upload.open() as file:
+            try:
+                reader = PdfReader(file)
+                size = len(reader.pages)
+            except PyPdfError as e:
+                # documents pypdf cannot read are left to fitz
+                print(f"Error: {e}")
+                yield from PdfFile2.iter_docs(upload, batch_size, ocr_enabled, progress)
+                return
+
+            def page_images(i: int) -> List[PageImage]:
+                # pypdf does not expose where images are placed on the page
+                return [
+                    PageImage(image.name, image.data, *image.image.size)
+                    for image in reader.pages[i].images
+                ]
+
+            # the text backend is picked per document by timing a few pages
+            texts = iter_texts(upload, select_backends(upload, size), size)
+            yield from iter_pdf_batches(
+                texts, page_images, size, batch_size, ocr_enabled, progress
+            )
 
-class PdfFile(File):
     @classmethod
-    def from_bytes(cls, file: BytesIO) -> "PdfFile":
-        reader = PdfReader(file)
-        docs = []
-        uuids = {}
-        parsing_bar = st.progress(0.0, text="progress")
-
-        size = len(reader.pages)
-        for i, page in enumerate(reader.pages):
-            text = page.extract_text()
-            text = strip_consecutive_newlines(text)
-            # check ocr enabled
-            if st.session_state["OCR_ENABLED"]:
-                for image_file_object in page.images:
-                    name = image_file_object.name
-                    response = parse_img(name, image_file_object.data)
-                    if response:
-                        uuids[response['uid']] = len(docs)
-                    sleep(5)
-            doc = Document(page_content=text.strip())
-            doc.metadata["page"] = i + 1
-            docs.append(doc)
-            # update progress
-            parsing_bar.progress(i / size, "Parsing PDF")
-        parsing_bar.progress(1.0, "Parsing PDF")
-        # retrieve images
-        progress_text = "Decoding Images"
-        # fetching responses
-        count = 0
-        while len(uuids.keys()) > 0 and count < 10:
-            progress = 0.0
-            size = len(uuids.keys())
-
-            for uuid, id in list(uuids.items()):
-                response = fetch_text(uuid)
-                if response['completed']:
-                    docs[id].page_content += f" ----- img_data ----- \n {response['document_text']} \n ----- end ----- "
-                    del uuids[uuid]
-                sleep(1)
-
-                # progress
-                progress += 1.0
-                parsing_bar.progress(id / size, "Decoding Images")
-
-            # add timeout
-            count += 1
-            sleep(10)
-        parsing_bar.progress(1.0, "Decoding Images")
-        # file.read() mutates the file object, which can affect caching
-        # so we need to reset the file pointer to the beginning
-        file.seek(0)
-        return cls(name=file.name, id=md5(file.read()).hexdigest(), docs=docs)
+    def from_upload(cls, upload: SpooledFile) -> "PdfFile":
+        docs = [doc for batch in cls.iter_docs(upload, batch_size=None) for doc in batch]
+        return cls(name=upload.name, id=upload.id, docs=docs)
 
 
 class PdfFile2(File):
+    STRIP_BOILERPLATE = True
+
     @classmethod
-    def from_bytes(cls, file: BytesIO) -> "PdfFile2":
-        pdf = fitz.open(stream=file.read(), filetype="pdf")  # type: ignore
-        docs = []
-        uuids = {}
-        parsing_bar = st.progress(0.0, text="progress")
-        size = len(pdf)
-        for i, page in enumerate(pdf):
-            text = page.get_text(sort=True)
-            text = strip_consecutive_newlines(text)
-            # check ocr enabled
-            if st.session_state["OCR_ENABLED"]:
-                for images in page.get_images():
-                    xref = images[0]
-                    img = pdf.extract_image(xref)
-                    name = str(xref)
-                    binary = img['image']
-                    response = parse_img(name, binary)
-                    if response:
-                        uuids[response['uid']] = len(docs)
-                    sleep(5)
-            doc = Document(page_content=text.strip())
-            doc.metadata["page"] = i + 1
-            docs.append(doc)
-            # update progress
-            parsing_bar.progress(i / size, "Parsing PDF")
-        # retrieve images
-        progress_text = "Decoding Images"
-        # fetching responses
-        count = 0
-        while len(uuids.keys()) > 0 and count < 10:
-            progress = 0.0
-            size = len(uuids.keys())
-
-            for uuid, id in list(uuids.items()):
-                response = fetch_text(uuid)
-                if response['completed']:
-                    docs[id].page_content += f" ----- img_data ----- \n {response['document_text']} \n ----- end ----- "
-                    del uuids[uuid]
-                sleep(1)
-
-                # progress
-                progress += 1.0
-                parsing_bar.progress(id / size, "Decoding Images")
-
-            # add timeout
-            count += 1
-            sleep(5)
-        # file.read() mutates the file object, which can affect caching
-        # so we need to reset the file pointer to the beginning
-        file.seek(0)
-        return cls(name=file.name, id=md5(file.read()).hexdigest(), docs=docs)
+    def iter_docs(
+            cls,
+            upload: SpooledFile,
+            batch_size: Optional[int] = STREAM_BATCH_SIZE,
+            ocr_enabled: bool = False,
+            progress: Optional[Progress] = None,
+    ) -> Iterator[List[Document]]:
+        import fitz
+
+        if upload.path:
+            pdf = fitz.open(upload.path)
+        else:
+            pdf = fitz.open(stream=upload.data, filetype="pdf")  # type: ignore
+
+        # images shared between pages have the same xref, extract them once
+        extracted: dict[int, dict] = {}
+
+        def page_images(i: int) -> List[PageImage]:
+            page = pdf[i]
+            page_area = abs(page.rect) or 1.0
+            images = []
+            for images_info in page.get_images():
+                xref = images_info[0]
+                if xref not in extracted:
+                    extracted[xref] = pdf.extract_image(xref)
+                img = extracted[xref]
+                placed_area = sum(abs(rect) for rect in page.get_image_rects(xref))
+                images.append(PageImage(
+                    str(xref),
+                    img['image'],
+                    img['width'],
+                    img['height'],
+                    min(1.0, placed_area / page_area),
+                ))
+            return images
+
+        with pdf:
+            size = len(pdf)
+            texts = iter_texts(upload, ["fitz", "pypdf"], size)
+            yield from iter_pdf_batches(
+                texts, page_images, size, batch_size, ocr_enabled, progress
+            )
 
+    @classmethod
+    def from_upload(cls, upload: SpooledFile) -> "PdfFile2":
+        docs = [doc for batch in cls.iter_docs(upload, batch_size=None) for doc in batch]
+        return cls(name=upload.name, id=upload.id, docs=docs)
 
+
+@register_parser(".txt", "text/plain")
 class TxtFile(File):
     @classmethod
-    def from_bytes(cls, file: BytesIO) -> "TxtFile":
-        text = file.read().decode("utf-8")
+    def from_upload(cls, upload: SpooledFile) -> "TxtFile":
+        text = str(upload.data, "utf-8")
         text = strip_consecutive_newlines(text)
-        file.seek(0)
         doc = Document(page_content=text.strip())
-        return cls(name=file.name, id=md5(file.read()).hexdigest(), docs=[doc])
+        return cls(name=upload.name, id=upload.id, docs=[doc])
+
+
+def format_row(values: Tuple[Any, ...]) -> str:
+    return " | ".join("" if value is None else str(value).strip() for value in values)
 
 
+@register_parser(".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
 class XLFile(File):
+    # number of rows in each document, the header row is repeated in every one
+    ROWS_PER_DOC = 50
+
     @classmethod
-    def from_bytes(cls, file: BytesIO) -> "XLFile":
-        dataframes = pd.read_excel(file, None)
-        docs = []
-        for title, dataframe in dataframes.items():
-            dataframe = strip_consecutive_newlines(dataframe.to_string())
-            file.seek(0)
-            doc = Document(page_content=dataframe.strip())
-            docs.append(doc)
-        return cls(name=file.name, id=md5(file.read()).hexdigest(), docs=docs)
+    def iter_docs(
+            cls,
+            upload: SpooledFile,
+            batch_size: Optional[int] = STREAM_BATCH_SIZE,
+            ocr_enabled: bool = False,
+            progress: Optional[Progress] = None,
+    ) -> Iterator[List[Document]]:
+        from openpyxl import load_workbook
+
+        with upload.open() as file:
+            # read only mode streams rows instead of loading whole sheets
+            workbook = load_workbook(file, read_only=True, data_only=True)
+            try:
+                docs = (
+                    doc
+                    for sheet in workbook.worksheets
+                    for doc in cls._iter_sheet_docs(sheet)
+                )
+                yield from batch_docs(docs, batch_size)
+            finally:
+                workbook.close()
 
+    @classmethod
+    def _iter_sheet_docs(cls, sheet) -> Iterator[Document]:
+        """Yields documents of ROWS_PER_DOC rows for a worksheet"""
+        header = None
+        rows = []
+        first_row = last_row = 0
+        for row_number, values in enumerate(sheet.iter_rows(values_only=True), start=1):
+            if all(value is None or str(value).strip() == "" for value in values):
+                continue
+            row = strip_consecutive_newlines(format_row(values))
+            if header is None:
+                header = row
+                first_row = last_row = row_number
+                continue
+            if not rows:
+                first_row = row_number
+            rows.append(row)
+            last_row = row_number
+            if len(rows) == cls.ROWS_PER_DOC:
+                yield cls._rows_doc(sheet.title, header, rows, first_row, last_row)
+                rows = []
+        if rows or (header is not None and last_row == first_row):
+            # the remaining rows, or a sheet holding nothing but its header
+            yield cls._rows_doc(sheet.title, header, rows, first_row, last_row)
+
+    @staticmethod
+    def _rows_doc(title: str, header: str, rows: List[str], first_row: int, last_row: int) -> Document:
+        text = "\n".join([f"Sheet: {title}", header, *rows])
+        return Document(
+            page_content=text,
+            metadata={"sheet": title, "rows": f"{first_row}-{last_row}"},
+        )
 
+    @classmethod
+    def from_upload(cls, upload: SpooledFile) -> "XLFile":
+        docs = [doc for batch in cls.iter_docs(upload, batch_size=None) for doc in batch]
+        return cls(name=upload.name, id=upload.id, docs=docs)
+
+
+def reading_order(shapes) -> List[Any]:
+    """Shapes sorted top to bottom then left to right, python-pptx lists them
+    in z-order. Shapes without a position keep their order at the end.
+    """
+    placed = [shape for shape in shapes if shape.top is not None and shape.left is not None]
+    unplaced = [shape for shape in shapes if shape.top is None or shape.left is None]
+    return sorted(placed, key=lambda shape: (shape.top, shape.left)) + unplaced
+
+
+def iter_shape_text(shapes) -> Iterator[Tuple[Any, str, str]]:
+    """Yields (shape, kind, text) for every shape holding text in reading order,
+    recursing into groups whose shapes are ordered within the group
+    """
+    from pptx.enum.shapes import MSO_SHAPE_TYPE
+
+    for shape in reading_order(shapes):
+        if shape.shape_type == MSO_SHAPE_TYPE.GROUP:
+            yield from iter_shape_text(shape.shapes)
+        elif shape.has_text_frame:
+            lines = [
+                "".join(run.text for run in paragraph.runs).strip()
+                for paragraph in shape.text_frame.paragraphs
+            ]
+            yield shape, "text", "\n".join(line for line in lines if line)
+        elif shape.has_table:
+            rows = [
+                " | ".join(cell.text.strip() for cell in row.cells)
+                for row in shape.table.rows
+            ]
+            yield shape, "table", "\n".join(rows)
+
+
+@register_parser(
+    ".pptx", "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+)
 class PPTFile(File):
+    STRIP_BOILERPLATE = True
+
     @classmethod
-    def from_bytes(cls, file: BytesIO) -> "PPTFile":
+    def from_upload(cls, upload: SpooledFile) -> "PPTFile":
+        from pptx import Presentation
+
         # read file
-        prs = Presentation(file)
+        with upload.open() as file:
+            prs = Presentation(file)
 
         docs = []
-        # loop on slides
+        # one document per slide, shapes top to bottom and left to right followed by the notes
         for i, slide in enumerate(prs.slides):
-            for shape in slide.shapes:
-                if not shape.has_text_frame:
+            parts = []
+            shapes = []
+            for shape, kind, text in iter_shape_text(slide.shapes):
+                if not text:
                     continue
-                for paragraph in shape.text_frame.paragraphs:
-                    for run in paragraph.runs:
-                        doc = Document(page_content=run.text.strip())
-                        doc.metadata["page"] = i + 1
-                        docs.append(doc)
-        file.seek(0)
-        return cls(name=file.name, id=md5(file.read()).hexdigest(), docs=docs)
+                parts.append(text)
+                shapes.append({"name": shape.name, "type": kind})
+            # notes slides without a body placeholder have no text frame
+            notes_frame = slide.notes_slide.notes_text_frame if slide.has_notes_slide else None
+            if notes_frame is not None:
+                notes = notes_frame.text.strip()
+                if notes:
+                    parts.append(f"Notes: {notes}")
+                    shapes.append({"name": "notes", "type": "notes"})
+            if not parts:
+                continue
+
+            doc = Document(page_content=strip_consecutive_newlines("\n".join(parts)))
+            doc.metadata["page"] = i + 1
+            doc.metadata["shapes"] = shapes
+            title = slide.shapes.title
+            if title is not None and title.has_text_frame:
+                doc.metadata["title"] = title.text_frame.text.strip()
+            docs.append(doc)
+        return cls(name=upload.name, id=upload.id, docs=docs)
+
+
+def sniff_mime_type(upload: SpooledFile) -> Optional[str]:
+    """Guesses the MIME type of an upload from its content"""
+    head = bytes(upload.data[:4])
+    if head == b"%PDF":
+        return "application/pdf"
+    if head == b"PK\x03\x04":
+        # office documents are zip archives, tell them apart by their main folder
+        import zipfile
+
+        folders = {
+            "word/": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+            "ppt/": "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+            "xl/": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        }
+        try:
+            with upload.open() as file, zipfile.ZipFile(file) as archive:
+                names = archive.namelist()
+        except zipfile.BadZipFile:
+            return None
+        for folder, mime_type in folders.items():
+            if any(name.startswith(folder) for name in names):
+                return mime_type
+        return None
+    # incremental decoding tolerates a character cut at the end of the sample
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        decoder.decode(bytes(upload.data[:4096]), final=len(upload.data) <= 4096)
+    except UnicodeDecodeError:
+        return None
+    return "text/plain"
 
 
-def read_file(file: BytesIO) -> File:
+def get_file_type(
+        name: str, mime_type: Optional[str] = None, upload: Optional[SpooledFile] = None
+) -> Type[File]:
+    """Returns the File subclass that parses a file, looked up by extension,
+    then by the declared MIME type, then by sniffing the content of the upload
+    """
+    extension = os.path.splitext(name)[1].lower()
+    if extension in PARSERS_BY_EXTENSION:
+        return PARSERS_BY_EXTENSION[extension]
+    if mime_type in PARSERS_BY_MIME_TYPE:
+        return PARSERS_BY_MIME_TYPE[mime_type]
+    if upload is not None:
+        sniffed = sniff_mime_type(upload)
+        if sniffed in PARSERS_BY_MIME_TYPE:
+            return PARSERS_BY_MIME_TYPE[sniffed]
+    raise NotImplementedError(f"File type {name.split('.')[-1]} not supported")
+
+
+def parse_cache_key(file_id: str, ocr_enabled: bool = False) -> str:
+    """Parse results depend on the parser version and on whether images are OCR'd"""
+    ocr = "ocr" if ocr_enabled else "text"
+    return f"{file_id}-{PARSER_VERSION}-{ocr}"
+
+
+def remove_boilerplate(
+        file: File, docs: List[Document], boilerplate: Optional[Dict[str, str]] = None
+) -> Dict[str, str]:
+    """Strips lines repeated on most pages from docs, keeping them once in the
+    file metadata. The lines are found in docs unless boilerplate is given.
+    """
+    if boilerplate is None:
+        boilerplate = find_boilerplate(docs)
+        file.metadata["boilerplate"] = list(boilerplate.values())
+    strip_boilerplate(docs, boilerplate)
+    return boilerplate
+
+
+def read_file(
+        file: BytesIO, ocr_enabled: bool = False, progress: Optional[Progress] = None
+) -> File:
     """Reads an uploaded file and returns a File object"""
-    if file.name.lower().endswith(".docx"):
-        return DocxFile.from_bytes(file)
-    elif file.name.lower().endswith(".pdf"):
-        return PdfFile.from_bytes(file)
-    elif file.name.lower().endswith(".txt"):
-        return TxtFile.from_bytes(file)
-    elif file.name.lower().endswith(".pptx"):
-        return PPTFile.from_bytes(file)
-    elif file.name.lower().endswith(".xlsx"):
-        return XLFile.from_bytes(file)
-    else:
-        raise NotImplementedError(f"File type {file.name.split('.')[-1]} not supported")
+    with SpooledFile.from_upload(file) as upload:
+        file_type = get_file_type(upload.name, upload.type, upload)
+        key = parse_cache_key(upload.id, ocr_enabled)
+        cached = parse_cache.get(key)
+        if cached is not None:
+            return file_type.from_dict({**cached, "name": upload.name})
+
+        docs = [
+            doc
+            for batch in file_type.iter_docs(upload, None, ocr_enabled, progress)
+            for doc in batch
+        ]
+        parsed_file = file_type(name=upload.name, id=upload.id, docs=docs)
+    if file_type.STRIP_BOILERPLATE:
+        remove_boilerplate(parsed_file, parsed_file.docs)
+    parse_cache.put(key, parsed_file.to_dict())
+    return parsed_file
+
+
+def stream_file(
+        file: Union[BytesIO, SpooledFile],
+        batch_size: Optional[int] = STREAM_BATCH_SIZE,
+        ocr_enabled: bool = False,
+        progress: Optional[Progress] = None,
+) -> Tuple[File, Iterator[List[Document]]]:
+    """Reads an uploaded file incrementally.
+
+    Returns a File with no docs yet and an iterator over batches of parsed
+    Documents, each batch is appended to the File's docs as it is consumed.
+    Files with boilerplate are held back until SAMPLE_PAGES pages are parsed,
+    the lines are learned from those pages like read_file does and stripped
+    from every batch, so both cache the same result.
+    An upload that is already spooled is not read again, it is closed once
+    the batches are consumed.
+    """
+    upload = file if isinstance(file, SpooledFile) else SpooledFile.from_upload(file)
+    try:
+        file_type = get_file_type(upload.name, upload.type, upload)
+    except NotImplementedError:
+        upload.close()
+        raise
+    parsed_file = file_type(name=upload.name, id=upload.id)
+    key = parse_cache_key(upload.id, ocr_enabled)
+
+    def batches() -> Iterator[List[Document]]:
+        with upload:
+            cached = parse_cache.get(key)
+            if cached is not None:
+                cached_file = file_type.from_dict(cached)
+                parsed_file.metadata.update(cached_file.metadata)
+                parsed_file.docs.extend(cached_file.docs)
+                yield cached_file.docs
+                return
+
+            boilerplate = None
+            sample: List[Document] = []
+            for docs in file_type.iter_docs(upload, batch_size, ocr_enabled, progress):
+                if file_type.STRIP_BOILERPLATE and boilerplate is None:
+                    sample.extend(docs)
+                    if len(sample) < SAMPLE_PAGES:
+                        continue
+                    docs, sample = sample, []
+                if file_type.STRIP_BOILERPLATE:
+                    boilerplate = remove_boilerplate(parsed_file, docs, boilerplate)
+                parsed_file.docs.extend(docs)
+                yield docs
+            if sample:
+                remove_boilerplate(parsed_file, sample)
+                parsed_file.docs.extend(sample)
+                yield sample
+        parse_cache.put(key, parsed_file.to_dict())
+
+    return parsed_file, batches()
 
 
 def scrape_url(url: str) -> List[File]:
+    # scrapy and twisted are heavy, only load them when a url is scraped
+    from Main.core.WebScrapper import run_spider
+
     # scrape url
     DICT = run_spider(url)
     # return into files
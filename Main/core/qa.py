@@ -51,7 +51,7 @@ def Wolf_analyse(text: str):
 
 
 def get_relevant_docs(query: str, search_query: str, folder_index: FolderIndex) -> AnswerWithSources:
-    relevant_docs = folder_index.index.similarity_search(search_query)
+    relevant_docs = folder_index.search(search_query)
 
     messages = [
         {"role": "system",
@@ -112,7 +112,7 @@ def query_folder(
         prompt=STUFF_PROMPT,
     )
 
-    relevant_docs = folder_index.index.similarity_search(query)
+    relevant_docs = folder_index.search(query)
     result = chain(
         {"input_documents": relevant_docs, "question": query}, return_only_outputs=True
     )
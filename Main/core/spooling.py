@@ -0,0 +1,138 @@
+import io
+import mmap
+import os
+import tempfile
+from hashlib import md5
+from typing import BinaryIO, Optional, Union
+
+# uploads larger than this are spooled to a memory mapped temp file
+SPOOL_THRESHOLD = int(os.environ.get("SPOOL_THRESHOLD", 32 * 1024 ** 2))
+# size of the blocks copied and hashed at a time while spooling
+SPOOL_BLOCK_SIZE = 1024 ** 2
+
+Buffer = Union[bytes, memoryview, mmap.mmap]
+
+
+class BufferReader(io.RawIOBase):
+    """A seekable file object reading from a buffer without copying it,
+    BytesIO copies anything that is not bytes
+    """
+
+    def __init__(self, data: Buffer):
+        self._view = memoryview(data)
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        chunk = self._view[self._position:self._position + len(buffer)]
+        buffer[:len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        start = {os.SEEK_SET: 0, os.SEEK_CUR: self._position, os.SEEK_END: len(self._view)}
+        self._position = max(0, start[whence] + offset)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+    def close(self) -> None:
+        self._view.release()
+        super().close()
+
+
+class SpooledFile:
+    """An uploaded file read and hashed in a single pass.
+
+    Small uploads are read through a view of their in memory buffer, larger
+    ones are copied block by block to a temp file and memory mapped, so
+    parsers share the page cache instead of holding their own copy of the
+    upload. The id is the md5 of the content, computed while reading.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            id: str,
+            data: Buffer,
+            path: Optional[str] = None,
+            type: Optional[str] = None,
+    ):
+        self.name = name
+        self.id = id
+        self.data = data
+        self.path = path
+        # MIME type the upload was declared with, if any
+        self.type = type
+
+    @classmethod
+    def from_upload(
+            cls, file: BinaryIO, threshold: int = SPOOL_THRESHOLD
+    ) -> "SpooledFile":
+        """Reads an upload from its start, leaving its pointer at the start"""
+        file.seek(0, os.SEEK_END)
+        size = file.tell()
+        file.seek(0)
+
+        mime_type = getattr(file, "type", None)
+        if size <= threshold:
+            # uploads held in memory are viewed in place rather than copied
+            data = file.getbuffer() if hasattr(file, "getbuffer") else file.read()
+            file.seek(0)
+            return cls(name=file.name, id=md5(data).hexdigest(), data=data, type=mime_type)
+
+        file_hash = md5()
+        fd, path = tempfile.mkstemp(suffix=os.path.splitext(file.name)[1])
+        with os.fdopen(fd, "wb") as tmp:
+            while block := file.read(SPOOL_BLOCK_SIZE):
+                file_hash.update(block)
+                tmp.write(block)
+        file.seek(0)
+        with open(path, "rb") as tmp:
+            data = mmap.mmap(tmp.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(
+            name=file.name, id=file_hash.hexdigest(), data=data, path=path, type=mime_type
+        )
+
+    @property
+    def source(self) -> Union[str, Buffer]:
+        """Path of the spooled file, or the buffer of a small upload"""
+        return self.path or self.data
+
+    def open(self) -> BinaryIO:
+        """A file object over the upload, for parsers that need one"""
+        if self.path:
+            return open(self.path, "rb")
+        return io.BufferedReader(BufferReader(self.data))
+
+    def spool_path(self) -> str:
+        """Path of the upload on disk, spooling small uploads on demand"""
+        if not self.path:
+            fd, path = tempfile.mkstemp(suffix=os.path.splitext(self.name)[1])
+            with os.fdopen(fd, "wb") as tmp:
+                tmp.write(self.data)
+            self.path = path
+        return self.path
+
+    def close(self) -> None:
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        elif isinstance(self.data, memoryview):
+            # lets the upload buffer be resized again
+            self.data.release()
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+        self.path = None
+
+    def __enter__(self) -> "SpooledFile":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
@@ -1,22 +1,19 @@
 import os
-import pinecone
 import openai
-import tiktoken
 
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 
+from Main.core.embedding import FolderIndex
+from Main.core.embedding_scheduler import EmbeddingScheduler, openai_embed
 from Main.core.parsing import File
 from Main.core.qa import query_folder, get_relevant_docs
+from Main.core.tokenizer import count_tokens
 import streamlit as st
 
 
 # create the length function
 def tiktoken_len(text: str):
-    tokens = tiktoken.get_encoding('p50k_base').encode(
-        text,
-        disallowed_special=()
-    )
-    return len(tokens)
+    return count_tokens(text, 'p50k_base')
 
 
 # retrieve files from pinecone
@@ -26,19 +23,40 @@ def retrieve(query: str, index):
     :param query:
     :return:
     """
+    return retrieve_many([query], index)[0]
+
+
+def retrieve_many(queries: list[str], index):
+    """
+    retrieve data from the db for several queries, embedded in a single request
+    unless the model has a query embedding of its own
+    :param queries:
+    :return: a prompt for each query
+    """
+    if isinstance(index, FolderIndex):
+        # one embedding request, for OpenAI, and one faiss search for all queries
+        return [
+            join_contexts([doc.page_content for doc in docs])
+            for docs in index.batch_search(queries, k=3)
+        ]
+
     res = openai.Embedding.create(
-        input=[query],
+        input=queries,
         engine="text-embedding-ada-002"
     )
 
-    # retrieve from Pinecone
-    xq = res['data'][0]['embedding']
+    prompts = []
+    for record in sorted(res['data'], key=lambda x: x['index']):
+        # retrieve from Pinecone
+        matches = index.query(record['embedding'], top_k=3, include_metadata=True)
+        contexts = [
+            x['metadata']['text'] for x in matches['matches']
+        ]
+        prompts.append(join_contexts(contexts))
+    return prompts
 
-    # get relevant contexts
-    res = index.query(xq, top_k=3, include_metadata=True)
-    contexts = [
-        x['metadata']['text'] for x in res['matches']
-    ]
+
+def join_contexts(contexts: list[str]):
     prompt = None
     # append contexts until hitting limit
     for i in range(1, len(contexts)):
@@ -70,8 +88,9 @@ def store_txt(files: list[File]):
     chunks = text_splitter.split_text(input_txt)
     # create Embedding
     embed_model = "text-embedding-ada-002"
+    # only the dimension is needed to create the index, store_data embeds the rest
     res = openai.Embedding.create(
-        input=chunks
+        input=chunks[:1]
         , engine=embed_model
     )
     data = [
@@ -86,6 +105,8 @@ def store_txt(files: list[File]):
 
 
 def init_pinecone(dimension):
+    import pinecone
+
     pinecone.init(api_key=st.session_state.get('PINECONE_API_KEY'),
                   enviroment=st.session_state.get('PINECONE_ENVIRONMENT'))
 
@@ -108,36 +129,24 @@ def init_pinecone(dimension):
 
 
 def store_data(data, embed_model, index):
-    from tqdm.auto import tqdm
-    from time import sleep
+    from functools import partial
+
+    # embed every chunk at once, packed into concurrent requests that are retried on errors
+    scheduler = EmbeddingScheduler(partial(openai_embed, model=embed_model), model_name=embed_model)
+    embeds = scheduler.embed([x['text'] for x in data])
 
-    batch_size = 100  # how many embeddings we create and insert at onceq
-    for i in tqdm(range(0, len(data), batch_size)):
+    batch_size = 100  # how many embeddings we insert at once
+    for i in range(0, len(data), batch_size):
         # find end of batch
         i_end = min(len(data), i + batch_size)
         meta_batch = data[i:i_end]
         # get ids
         ids_batch = [x['id'] for x in meta_batch]
-        # get texts to encode
-        texts = [x['text'] for x in meta_batch]
-        # create embeddings (try-except added to avoid RateLimitError)
-        try:
-            res = openai.Embedding.create(input=texts, engine=embed_model)
-        except:
-            done = False
-            while not done:
-                sleep(5)
-                try:
-                    res = openai.Embedding.create(input=texts, engine=embed_model)
-                    done = True
-                except:
-                    pass
-        embeds = [record['embedding'] for record in res['data']]
         # cleanup metadata
         meta_batch = [{
             'text': x['text'],
         } for x in meta_batch]
-        to_upsert = list(zip(ids_batch, embeds, meta_batch))
+        to_upsert = list(zip(ids_batch, embeds[i:i_end], meta_batch))
         # upsert to Pinecone
         index.upsert(vectors=to_upsert)
 
@@ -159,10 +168,11 @@ def complete(prompt):
     return answer
 
 
-def write_analysis(topic, folder_index):
+def write_analysis(topic, folder_index, retrieved=None):
     # retrieve relevant data
-    query = f"{topic}"
-    retrieved = retrieve(query, folder_index)
+    if retrieved is None:
+        query = f"{topic}"
+        retrieved = retrieve(query, folder_index)
     prompt = f"Write a short essay on {topic}, given the following information: \n" \
              f"{retrieved}"
     # prompt chatgpt for result
@@ -182,10 +192,12 @@ def write_report(folder_index):
         "Final Recommendations and Analysis": "final recomendation and analysis for the company's market approach and their financials",
     }
     out = ""
+    # one embedding request for every topic
+    retrieved = retrieve_many(list(topics.values()), folder_index)
 
-    for title, topic in topics.items():
+    for (title, topic), context in zip(topics.items(), retrieved):
         out += f"\n \n{title}: \n \n"
-        out += write_analysis(topic, folder_index)
+        out += write_analysis(topic, folder_index, context)
 
     return out
 
@@ -258,10 +270,9 @@ def website_summary(folder_index):
               "News and Press Release", "Contact Information", "Legal and Regulatory Compliance", "Social Media Links",
               "Client Testimonials", "Awards and Accolades", "Industry Affiliations", "CSR initiatives", "Job Openings",
               "Events and Conferences"]
-    # filter redundant data
+    # filter redundant data, all topics are embedded and searched at once
     Docs = {}
-    for topic in Topics:
-        relevant_docs = folder_index.index.similarity_search(topic, k=3)
+    for relevant_docs in folder_index.batch_search(Topics, k=3):
         for doc in relevant_docs:
             id = doc.metadata.get("file_id") + ":" + doc.metadata.get("source")
             if id not in Docs:
@@ -0,0 +1,17 @@
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model_name: str = "gpt-3.5-turbo"):
+    """Loads the tiktoken encoding of a model, or an encoding by name, once per process"""
+    import tiktoken
+
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding(model_name)
+
+
+def count_tokens(text: str, model_name: str = "gpt-3.5-turbo") -> int:
+    """Number of tokens in text for the specified model"""
+    return len(get_encoding(model_name).encode(text, disallowed_special=()))
@@ -0,0 +1,87 @@
+from io import BytesIO
+from typing import List, NamedTuple, Optional, Tuple
+
+# pages with less extracted text than this are candidates for being scans
+SCANNED_PAGE_CHARS = 50
+# a scanned page has an image covering at least this fraction of it
+SCANNED_PAGE_COVERAGE = 0.5
+# images with fewer pixels are icons, bullets and logos
+MIN_IMAGE_PIXELS = 150_000
+# images covering less of the page than this are decoration
+MIN_PAGE_COVERAGE = 0.1
+# images scoring below this in text_likelihood are photos or flat graphics
+MIN_TEXT_SCORE = 0.3
+
+
+class PageImage(NamedTuple):
+    """An image found on a page, coverage is None when its placement is unknown"""
+
+    name: str
+    data: bytes
+    width: int
+    height: int
+    coverage: Optional[float] = None
+
+
+def text_likelihood(data: bytes) -> Optional[float]:
+    """Rough estimate in [0, 1] of whether an image holds text, charts or tables.
+
+    Text sits on a flat background with many sharp edges, so the score is
+    the share of edge pixels weighted by how much of the image is covered
+    by its two dominant grey levels. None when the image cannot be decoded.
+    """
+    from PIL import Image, ImageFilter, ImageStat
+
+    try:
+        image = Image.open(BytesIO(data)).convert("L")
+    except Exception:
+        return None
+    image.thumbnail((256, 256))
+
+    edges = image.filter(ImageFilter.FIND_EDGES).point(lambda p: 255 if p > 64 else 0)
+    edge_share = ImageStat.Stat(edges).mean[0] / 255
+
+    histogram = image.quantize(16).histogram()
+    flatness = sum(sorted(histogram, reverse=True)[:2]) / max(1, sum(histogram))
+
+    return min(1.0, edge_share / 0.08) * flatness
+
+
+def triage_page(text: str, images: List[PageImage]) -> Tuple[List[PageImage], dict]:
+    """Picks the images of a page that are worth sending to OCR.
+
+    Large images on scanned pages are always picked, on pages with a text
+    layer only large images that look like they hold text are.
+    Returns the picked images and an audit record for the page metadata.
+    """
+    scanned = len(text.strip()) < SCANNED_PAGE_CHARS and any(
+        image.coverage is None or image.coverage >= SCANNED_PAGE_COVERAGE
+        for image in images
+        if image.width * image.height >= MIN_IMAGE_PIXELS
+    )
+
+    selected = []
+    skipped: dict[str, int] = {}
+    for image in images:
+        if image.width * image.height < MIN_IMAGE_PIXELS:
+            reason = "small"
+        elif scanned:
+            reason = None
+        elif image.coverage is not None and image.coverage < MIN_PAGE_COVERAGE:
+            reason = "low_coverage"
+        else:
+            score = text_likelihood(image.data)
+            reason = "no_text" if score is not None and score < MIN_TEXT_SCORE else None
+
+        if reason:
+            skipped[reason] = skipped.get(reason, 0) + 1
+        else:
+            selected.append(image)
+
+    audit = {
+        "scanned": scanned,
+        "images": len(images),
+        "submitted": len(selected),
+        "skipped": skipped,
+    }
+    return selected, audit
@@ -1,3 +1,5 @@
+from time import sleep
+
 import streamlit as st
 from PIL import Image
 
@@ -15,9 +17,10 @@ from Main.ui import (
 
 from Main.core.caching import bootstrap_caching
 
-from Main.core.parsing import read_file, scrape_url
-from Main.core.chunking import chunk_file
+from Main.core.parsing import scrape_url
+from Main.core.chunking import chunk_files
 from Main.core.embedding import embed_files
+from Main.core.ingestion import Ingestion
 from Main.core.qa import query_folder, get_query_answer, get_relevant_docs
 
 EMBEDDING = "openai"
@@ -78,48 +81,77 @@ summary = st.session_state.get("SUMMARY")
 # read files
 if update_btn:
 
-    files = []
     # check file or url
     if not file_or_url:
-        # turn uploaded files into file objects
-        for uploaded_file in uploaded_files:
-            try:
-                file = read_file(uploaded_file)
-                files.append(file)
-            except Exception as e:
-                display_file_read_error(e)
+        # parse, chunk and index uploaded files in the background
+        st.session_state["INGESTION"] = Ingestion(
+            uploaded_files,
+            embedding=EMBEDDING,
+            vector_store=VECTOR_STORE,
+            chunk_size=400,
+            chunk_overlap=50,
+            ocr_enabled=st.session_state.get("OCR_ENABLED", False),
+            # only the files that changed since the last update are indexed
+            previous=st.session_state.get("INGESTION"),
+            openai_api_key=openai_api_key,
+        ).start()
+        st.session_state["SUMMARY"] = summary = None
     else:
+        st.session_state["INGESTION"] = None
         progress_text = "Scraping the web... This may take a while⏳"
         my_bar = st.progress(0, text=progress_text)
         # scrape url and turn it into file objects
-        url_files = scrape_url(url)
-        files.extend(url_files)
+        files = scrape_url(url)
         my_bar.progress(100, text=progress_text)
-    st.session_state["FILES"] = files
-
-    # chunk files
-    chunked_files = []
-    for file in files:
-        chunked_file = chunk_file(file, chunk_size=400, chunk_overlap=50)
-        chunked_files.append(chunked_file)
-    st.session_state["CHUNKED_FILES"] = chunked_files
-
-    # save chunks to temp db
-    with st.spinner("Indexing document... This may take a while⏳"):
-        folder_index = embed_files(
-            files=chunked_files,
-            embedding=EMBEDDING,
-            vector_store=VECTOR_STORE,
-            openai_api_key=openai_api_key,
+        st.session_state["FILES"] = files
+
+        # chunk files
+        chunked_files = chunk_files(files, chunk_size=400, chunk_overlap=50)
+        st.session_state["CHUNKED_FILES"] = chunked_files
+
+        # save chunks to temp db
+        with st.spinner("Indexing document... This may take a while⏳"):
+            folder_index = embed_files(
+                files=chunked_files,
+                embedding=EMBEDDING,
+                vector_store=VECTOR_STORE,
+                chunk_size=400,
+                chunk_overlap=50,
+                openai_api_key=openai_api_key,
+            )
+        st.session_state["FOLDER_INDEX"] = folder_index
+
+        # create a summary
+        if len(chunked_files) > 0:
+            summary = get_summary(chunked_files[0])
+            st.session_state["SUMMARY"] = summary
+
+ingestion = st.session_state.get("INGESTION")
+if ingestion:
+    # pick up whatever has been indexed so far
+    files = st.session_state["FILES"] = ingestion.files
+    chunked_files = st.session_state["CHUNKED_FILES"] = ingestion.chunked_files
+    folder_index = st.session_state["FOLDER_INDEX"] = ingestion.folder_index
+    if ingestion.errors:
+        display_file_read_error(ingestion.errors[0])
+
+    if not ingestion.done:
+        st.progress(
+            ingestion.progress,
+            text=f"Indexed {ingestion.pages_indexed} pages, "
+                 f"{ingestion.files_done}/{len(ingestion.uploaded_files)} files"
+                 f"{f' ({ingestion.stage})' if ingestion.stage else ''}... "
+                 "You can ask questions while the rest loads⏳",
         )
-    st.session_state["FOLDER_INDEX"] = folder_index
-
-    # create a summary
-    if len(chunked_files) > 0:
+        if folder_index is None:
+            sleep(1)
+            st.rerun()
+    elif not summary and len(chunked_files) > 0:
+        # create a summary once everything is parsed
         summary = get_summary(chunked_files[0])
         st.session_state["SUMMARY"] = summary
 
-elif not files:
+if not files:
     st.stop()
 
 
@@ -207,5 +239,14 @@ if st.session_state.get("messages"):
                         {source.page_content}
                         """
             st.write(message)
-            st.markdown(source.metadata["file_name"]+" : "+source.metadata["source"])
+            # near-duplicate chunks list every place they occur
+            locations = source.metadata.get("sources") or [source.metadata]
+            st.markdown(", ".join(
+                location["file_name"] + " : " + location["source"] for location in locations
+            ))
             st.markdown("---")
+
+# keep refreshing the indexing progress while files are still loading
+if ingestion and not ingestion.done:
+    sleep(2)
+    st.rerun()
@@ -0,0 +1,67 @@
+"""Measures what importing the app costs and checks parser dependencies stay lazy.
+
+    python benchmarks/import_time.py [--module Main.core.parsing] [--top 15] [--repeat 5]
+
+Runs python -X importtime in fresh interpreters, reports the best cumulative
+import time of the module, the slowest imports below it and fails when one of
+the parser or scraping dependencies is imported eagerly.
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# imported by the parser or helper that needs them, never at import time
+LAZY_MODULES = ["fitz", "pypdf", "pptx", "openpyxl", "scrapy", "twisted", "pinecone", "tiktoken"]
+
+
+def import_times(code: str) -> Dict[str, int]:
+    """Cumulative import time in microseconds of every module code imports"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise SystemExit(result.stderr.strip().splitlines()[-1])
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="Main.core.parsing")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    # modules the interpreter imports at startup are not the app's doing
+    startup = import_times("pass")
+    runs = [import_times(f"import {args.module}") for _ in range(args.repeat)]
+    best = min(runs, key=lambda times: times.get(args.module, 0))
+    print(f"import {args.module}: {best.get(args.module, 0) / 1000:.1f} ms (best of {args.repeat})")
+
+    top_level = {name: us for name, us in best.items() if "." not in name and name not in startup}
+    print(f"{'module':<30} {'ms':>8}")
+    for name, us in sorted(top_level.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{name:<30} {us / 1000:>8.1f}")
+
+    eager = [name for name in LAZY_MODULES if name in best]
+    if eager:
+        raise SystemExit(f"imported eagerly: {', '.join(eager)}")
+    print("parser dependencies are imported lazily")
+
+
+if __name__ == "__main__":
+    main()
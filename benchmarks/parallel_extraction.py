@@ -0,0 +1,63 @@
+"""Measures when extracting PDF text across worker processes beats doing it in process.
+
+    python benchmarks/parallel_extraction.py [--workers 4] [--pages 4 8 16 32 64 128 256]
+
+Times iter_texts in process and with a pool of spawned workers over
+generated PDFs, then fits serial = pages * per_page and
+parallel = startup + pages * per_page / workers to report the page count
+where the pool starts paying off. MIN_PARALLEL_PAGES in
+Main/core/extraction.py is set from this break-even point.
+"""
+import argparse
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.pdfs import make_pdf  # noqa: E402
+from Main.core import extraction  # noqa: E402
+from Main.core.spooling import SpooledFile  # noqa: E402
+
+
+def timed(upload: SpooledFile, pages: int, workers: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = perf_counter()
+        texts = list(extraction.iter_texts(upload, ["fitz"], pages, workers=workers))
+        best = min(best, perf_counter() - started)
+        assert len(texts) == pages
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--pages", type=int, nargs="+", default=[4, 8, 16, 32, 64, 128, 256])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # time the pool at every size, the threshold is what is being measured
+    extraction.MIN_PARALLEL_PAGES = 0
+    print(f"cpus={os.cpu_count()} workers={args.workers}")
+    print(f"{'pages':>6} {'serial s':>10} {'pool s':>10} {'speedup':>8}")
+    results = []
+    for pages in args.pages:
+        with SpooledFile.from_upload(make_pdf(pages, "mixed")) as upload:
+            serial = timed(upload, pages, 1, args.repeat)
+            pool = timed(upload, pages, args.workers, args.repeat)
+        results.append((pages, serial, pool))
+        print(f"{pages:>6} {serial:>10.3f} {pool:>10.3f} {serial / pool:>8.2f}")
+
+    per_page = sum(serial for _, serial, _ in results) / sum(pages for pages, _, _ in results)
+    startup = min(pool - pages * per_page / args.workers for pages, _, pool in results)
+    measured = next((pages for pages, serial, pool in results if pool < serial), None)
+    print(f"per page {per_page * 1000:.2f} ms, pool startup {startup:.3f} s")
+    if args.workers > 1:
+        modeled = startup / (per_page * (1 - 1 / args.workers))
+        print(f"modeled break-even with {args.workers} workers: {modeled:.0f} pages")
+    print(f"measured break-even: {measured if measured else 'none in range'} pages")
+
+
+if __name__ == "__main__":
+    main()
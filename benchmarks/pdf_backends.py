@@ -0,0 +1,51 @@
+"""Compares the PDF text backends on generated documents.
+
+    python benchmarks/pdf_backends.py [--pages 40] [--kinds text table mixed] [--repeat 3]
+
+For every kind of document, times full text extraction with each backend
+in OPENERS, counts the characters it yields and what select_backends costs
+and picks on the same document. DEFAULT_BACKENDS in Main/core/extraction.py
+is ordered from these results.
+"""
+import argparse
+import os
+import sys
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.pdfs import make_pdf  # noqa: E402
+from Main.core import extraction  # noqa: E402
+from Main.core.spooling import SpooledFile  # noqa: E402
+
+
+def extract(backend: str, upload: SpooledFile, pages: int) -> int:
+    page_text = extraction.OPENERS[backend](upload.source)
+    return sum(len(page_text(i).strip()) for i in range(pages))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--kinds", nargs="+", default=["text", "table", "mixed"])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'kind':<6} {'backend':<8} {'ms/page':>8} {'chars':>8}")
+    for kind in args.kinds:
+        with SpooledFile.from_upload(make_pdf(args.pages, kind)) as upload:
+            for backend in extraction.OPENERS:
+                best = float("inf")
+                for _ in range(args.repeat):
+                    started = perf_counter()
+                    chars = extract(backend, upload, args.pages)
+                    best = min(best, perf_counter() - started)
+                print(f"{kind:<6} {backend:<8} {best / args.pages * 1000:>8.2f} {chars:>8}")
+
+            started = perf_counter()
+            order = extraction.select_backends(upload, args.pages, backends=list(extraction.OPENERS))
+            print(f"{kind:<6} selected {', '.join(order)} in {(perf_counter() - started) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
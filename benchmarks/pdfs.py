@@ -0,0 +1,41 @@
+"""Generates PDFs to benchmark text extraction on, no corpus needs to be shipped."""
+import random
+from io import BytesIO
+
+WORDS = (
+    "revenue growth margin customer market product platform ebitda pipeline "
+    "segment churn retention pricing contract enterprise region forecast "
+    "acquisition synergy headcount capex working capital quarter annual"
+).split()
+
+
+def _paragraph(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def make_pdf(pages: int, kind: str = "text", seed: int = 1) -> BytesIO:
+    """A PDF of pages pages, kind is "text" for prose, "table" for grids of
+    figures or "mixed" for slides alternating both.
+    The returned buffer has a name so it can stand in for an upload.
+    """
+    import fitz
+
+    rng = random.Random(seed)
+    pdf = fitz.open()
+    for i in range(pages):
+        page = pdf.new_page()
+        page_kind = kind if kind != "mixed" else ("text", "table")[i % 2]
+        page.insert_text((72, 60), f"Section {i + 1}: {rng.choice(WORDS).title()}", fontsize=16)
+        if page_kind == "text":
+            body = "\n\n".join(_paragraph(rng, 60) for _ in range(5))
+            page.insert_textbox(fitz.Rect(72, 80, 540, 760), body, fontsize=10)
+        else:
+            for row in range(30):
+                cells = [rng.choice(WORDS)] + [f"{rng.uniform(-50, 500):.1f}" for _ in range(6)]
+                for col, cell in enumerate(cells):
+                    page.insert_text((72 + col * 68, 90 + row * 20), cell, fontsize=9)
+        page.insert_text((72, 800), f"Confidential - Page {i + 1} of {pages}", fontsize=8)
+
+    buffer = BytesIO(pdf.tobytes())
+    buffer.name = f"{kind}_{pages}.pdf"
+    return buffer
@@ -0,0 +1,171 @@
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class OCRStub:
+    """Local stand-in of the doxter OCR endpoints.
+
+    Images are told apart by their upload file name, behaviors maps a name to
+    how the stub answers for it: "polls" results that are still pending
+    before the text is returned, "fail" to reject the submit with a 500,
+    "hang" seconds to wait before answering the submit and "delay" seconds
+    every submit takes.
+    """
+
+    def __init__(self):
+        self.behaviors = {}
+        self.delay = 0.0
+        self.submits = []
+        self.polls = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, name: str):
+        behavior = self.behaviors.get(name, {})
+        with self._lock:
+            self.submits.append(name)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(behavior.get("hang", self.delay))
+            if behavior.get("fail"):
+                return 500, {"detail": "failed"}
+            uid = str(uuid.uuid4())
+            with self._lock:
+                self._jobs[uid] = name
+                self.polls[uid] = []
+            return 200, {"uid": uid}
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def result(self, uid: str):
+        with self._lock:
+            name = self._jobs.get(uid)
+            if name is None:
+                return 404, {"detail": "not found"}
+            self.polls[uid].append(time.monotonic())
+            pending = self.behaviors.get(name, {}).get("polls", 0)
+            if len(self.polls[uid]) <= pending:
+                return 200, {"completed": False}
+        return 200, {"completed": True, "document_text": f"text of {name}"}
+
+    def poll_times(self, name: str):
+        return next(times for uid, times in self.polls.items() if self._jobs[uid] == name)
+
+
+class JSONHandler(BaseHTTPRequestHandler):
+    """Request handler of the stubs, answering with JSON bodies"""
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except OSError:
+            # the client gave up on a hung request
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(handler):
+    """Serves handler on a local port in a background thread, returns the server"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stop(server):
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def ocr_stub(monkeypatch, tmp_path):
+    """Runs an OCRStub on a local port and points the OCR client and cache at it"""
+    from Main.core import PDF_Parser, ocr
+    from Main.core.parse_cache import ParseCache
+
+    stub = OCRStub()
+
+    class Handler(JSONHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            name = re.search(rb'filename="([^"]+)"', body).group(1).decode("utf-8")
+            self._reply(*stub.submit(name))
+
+        def do_GET(self):
+            self._reply(*stub.result(self.path.rsplit("/", 1)[-1]))
+
+    server = serve(Handler)
+    monkeypatch.setattr(PDF_Parser, "OCR_API_URL", f"http://127.0.0.1:{server.server_port}/")
+    monkeypatch.setattr(ocr, "ocr_cache", ParseCache(str(tmp_path / "ocr_cache"), 1024 ** 2))
+    yield stub
+    stop(server)
+
+
+class EmbeddingStub:
+    """Local stand-in of the OpenAI embeddings endpoint.
+
+    Every text is embedded as [its length, its position in the request],
+    failures lists the statuses the next requests are answered with before
+    they succeed and every request takes delay seconds.
+    """
+
+    def __init__(self):
+        self.failures = []
+        self.delay = 0.0
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def embed(self, body: dict):
+        with self._lock:
+            self.requests.append(body["input"])
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            status = self.failures.pop(0) if self.failures else 200
+        try:
+            time.sleep(self.delay)
+            if status != 200:
+                return status, {"error": {"message": f"status {status}", "type": "stub"}}
+            data = [
+                {"object": "embedding", "index": i, "embedding": [float(len(text)), float(i)]}
+                for i, text in enumerate(body["input"])
+            ]
+            return 200, {"object": "list", "data": data, "model": body["model"], "usage": {}}
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+@pytest.fixture
+def embedding_stub(monkeypatch):
+    """Runs an EmbeddingStub on a local port and points OPENAI_API_BASE at it"""
+    stub = EmbeddingStub()
+
+    class Handler(JSONHandler):
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self._reply(*stub.embed(json.loads(body)))
+
+    server = serve(Handler)
+    monkeypatch.setenv("OPENAI_API_BASE", f"http://127.0.0.1:{server.server_port}/v1")
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    yield stub
+    stop(server)
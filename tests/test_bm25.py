@@ -0,0 +1,48 @@
+from Main.core.bm25 import BM25Index
+
+
+def index(texts):
+    bm25 = BM25Index()
+    for i, text in enumerate(texts):
+        bm25.add(str(i), text)
+    return bm25
+
+
+# "revenue" and "2022" are in most chunks, "acme" and "ebitda" in few
+TEXTS = [
+    "acme revenue 2022 grew",
+    "revenue 2022 by segment",
+    "revenue 2022 by region",
+    "revenue 2022 outlook",
+    "ebitda margin 2022 improved",
+    "headcount 2021",
+]
+
+
+def test_best_match_holding_every_term_is_confident():
+    bm25 = index(TEXTS)
+    query = "acme revenue"
+
+    assert bm25.is_confident(query, bm25.search(query))
+
+
+def test_best_match_missing_a_rare_term_is_not_confident():
+    bm25 = index(TEXTS)
+    # no chunk holds both, the best hits only share the common term
+    query = "ebitda revenue acme outlook"
+
+    assert not bm25.is_confident(query, bm25.search(query))
+
+
+def test_best_match_missing_only_a_common_term_is_confident():
+    bm25 = index(TEXTS)
+    query = "ebitda margin 2022 revenue"
+
+    assert bm25.is_confident(query, bm25.search(query))
+
+
+def test_questions_and_empty_results_are_not_confident():
+    bm25 = index(TEXTS)
+
+    assert not bm25.is_confident("acme revenue?", bm25.search("acme revenue?"))
+    assert not bm25.is_confident("unknown", bm25.search("unknown"))
@@ -0,0 +1,43 @@
+import pytest
+
+pytest.importorskip("langchain")
+
+from langchain.docstore.document import Document  # noqa: E402
+
+from Main.core.boilerplate import find_boilerplate, strip_boilerplate  # noqa: E402
+
+
+def pages(texts):
+    return [Document(page_content=text, metadata={"page": i + 1}) for i, text in enumerate(texts)]
+
+
+def test_figures_with_the_same_layout_on_every_page_survive():
+    docs = pages([
+        f"Acme Corp\nSegment {i} results\nRevenue ($m) {100 + i} {120 + i}\n"
+        f"EBITDA margin {10 + i}.1%\nheadcount {378 + i}.7 {343 + i}.3\n42\n"
+        f"Confidential - Page {i + 1} of 6\n{i + 1}"
+        for i in range(6)
+    ])
+
+    boilerplate = find_boilerplate(docs)
+    strip_boilerplate(docs, boilerplate)
+
+    assert sorted(boilerplate.values()) == ["1", "Acme Corp", "Confidential - Page 1 of 6"]
+    assert docs[2].page_content == (
+        "Segment 2 results\nRevenue ($m) 102 122\nEBITDA margin 12.1%\nheadcount 380.7 345.3\n42"
+    )
+    assert all(doc.page_content for doc in docs)
+
+
+def test_lines_repeated_exactly_are_boilerplate():
+    docs = pages([f"Draft - do not distribute\nsection {i} body" for i in range(4)])
+
+    strip_boilerplate(docs, find_boilerplate(docs))
+
+    assert [doc.page_content for doc in docs] == [f"section {i} body" for i in range(4)]
+
+
+def test_short_documents_are_left_alone():
+    docs = pages(["Header\none", "Header\ntwo"])
+
+    assert find_boilerplate(docs) == {}
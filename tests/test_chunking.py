@@ -0,0 +1,21 @@
+import pytest
+
+pytest.importorskip("langchain")
+
+from Main.core.chunking import doc_location  # noqa: E402
+
+
+def test_spreadsheets_are_cited_by_sheet_and_rows():
+    assert doc_location({"sheet": "Q3", "rows": "2-51", "page": 4}) == "Q3 rows 2-51"
+
+
+def test_word_documents_are_cited_by_section_and_table_rows():
+    section = {"section": "Results, by region", "heading_level": 1, "approx_page": 3, "page": 7}
+
+    assert doc_location(section) == "Results by region"
+    assert doc_location({**section, "table": 2, "rows": "2-9"}) == "Results by region table 2 rows 2-9"
+    assert doc_location({**section, "section": ""}) == "p. ~3"
+
+
+def test_other_documents_are_cited_by_page():
+    assert doc_location({"page": 5, "title": "Roadmap"}) == "5"
@@ -0,0 +1,123 @@
+import os
+import time
+
+import pytest
+
+pytest.importorskip("langchain")
+openai = pytest.importorskip("openai")
+pytest.importorskip("tiktoken")
+
+from Main.core import embedding_scheduler  # noqa: E402
+from Main.core.embedding_scheduler import (  # noqa: E402
+    EmbeddingScheduler,
+    ScheduledOpenAIEmbeddings,
+    TokenBucket,
+    openai_embed,
+    pack_batches,
+)
+
+
+def scheduler(**kwargs) -> EmbeddingScheduler:
+    """Scheduler sending its requests to the stub of the embedding_stub fixture"""
+
+    def embed_batch(texts):
+        return openai_embed(
+            texts,
+            model="text-embedding-ada-002",
+            api_key="test",
+            api_base=os.environ["OPENAI_API_BASE"],
+        )
+
+    kwargs.setdefault("bucket", TokenBucket(10 ** 9))
+    return EmbeddingScheduler(embed_batch, initial_delay=0.01, **kwargs)
+
+
+def test_texts_are_packed_by_tokens_and_inputs():
+    assert pack_batches([3, 3, 3, 10, 1], max_tokens=6) == [[0, 1], [2], [3], [4]]
+    assert pack_batches([1] * 5, max_tokens=100, max_inputs=2) == [[0, 1], [2, 3], [4]]
+    assert pack_batches([], max_tokens=6) == []
+
+
+def test_embeddings_come_back_in_input_order(embedding_stub):
+    texts = [" ".join(["word"] * n) for n in [2, 2, 5, 1, 3]]
+
+    embeddings = scheduler(max_batch_tokens=4).embed(texts)
+
+    assert [embedding[0] for embedding in embeddings] == [len(text) for text in texts]
+    assert sorted(embedding_stub.requests) == sorted([texts[0:2], texts[2:3], texts[3:5]])
+
+
+def test_requests_in_flight_are_capped(embedding_stub):
+    embedding_stub.delay = 0.1
+    texts = [f"text {i}" for i in range(8)]
+
+    scheduler(concurrency=2, max_batch_tokens=1).embed(texts)
+
+    assert len(embedding_stub.requests) == 8
+    assert embedding_stub.max_in_flight == 2
+
+
+def test_rate_limits_and_server_errors_are_retried_with_jitter(embedding_stub, monkeypatch):
+    embedding_stub.failures = [429, 502]
+    bounds = []
+    delays = []
+    monkeypatch.setattr(
+        embedding_scheduler.random, "uniform", lambda low, high: bounds.append((low, high)) or high / 2
+    )
+    monkeypatch.setattr(embedding_scheduler, "sleep", delays.append)
+
+    embeddings = scheduler().embed(["alpha", "beta"])
+
+    assert embeddings == [[5.0, 0.0], [4.0, 1.0]]
+    assert len(embedding_stub.requests) == 3
+    # full jitter: a random delay up to the exponential backoff of the attempt
+    assert bounds == [(0, 0.01), (0, 0.02)]
+    assert delays == [0.005, 0.01]
+
+
+def test_retries_give_up_after_max_retries(embedding_stub, monkeypatch):
+    embedding_stub.failures = [500, 500, 500]
+    monkeypatch.setattr(embedding_scheduler, "sleep", lambda delay: None)
+
+    with pytest.raises(openai.error.APIError):
+        scheduler(max_retries=1).embed(["alpha"])
+    assert len(embedding_stub.requests) == 2
+
+
+def test_invalid_requests_are_not_retried(embedding_stub):
+    embedding_stub.failures = [400]
+
+    with pytest.raises(openai.error.InvalidRequestError):
+        scheduler().embed(["alpha"])
+    assert len(embedding_stub.requests) == 1
+
+
+def test_token_bucket_throttles_past_its_budget():
+    # 100 tokens a second
+    bucket = TokenBucket(6000)
+    started = time.monotonic()
+    bucket.acquire(6000)
+    assert time.monotonic() - started < 0.1
+
+    bucket.acquire(30)
+    assert time.monotonic() - started >= 0.25
+
+
+def test_requests_wait_on_the_token_bucket(embedding_stub):
+    bucket = TokenBucket(6000)
+    bucket.acquire(6000)
+    texts = [" ".join(["word"] * 10)] * 3
+    started = time.monotonic()
+
+    scheduler(bucket=bucket, max_batch_tokens=10).embed(texts)
+
+    # three requests of 10 tokens at 100 tokens a second
+    assert time.monotonic() - started >= 0.25
+    assert len(embedding_stub.requests) == 3
+
+
+def test_openai_embeddings_are_sent_to_openai_api_base(embedding_stub):
+    embeddings = ScheduledOpenAIEmbeddings()
+
+    assert embeddings.embed_documents(["a", "bb"]) == [[1.0, 0.0], [2.0, 1.0]]
+    assert embedding_stub.requests == [["a", "bb"]]
@@ -0,0 +1,84 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("langchain")
+pytest.importorskip("faiss")
+
+from langchain.docstore.document import Document  # noqa: E402
+from langchain.docstore.in_memory import InMemoryDocstore  # noqa: E402
+from langchain.vectorstores.faiss import FAISS  # noqa: E402
+
+from Main.core.embedding import FolderIndex  # noqa: E402
+from Main.core.index_types import IndexConfig, build_index  # noqa: E402
+from Main.core.parsing import File  # noqa: E402
+
+CONFIGS = [
+    IndexConfig("flat"),
+    IndexConfig("ivf", nlist=2, nprobe=2),
+    IndexConfig("hnsw", hnsw_m=8, ef_search=64),
+]
+
+
+def docs_of(file_id, size):
+    return [
+        Document(page_content=f"{file_id} {i}", metadata={"file_id": file_id, "sources": []})
+        for i in range(size)
+    ]
+
+
+def folder_index(config, sizes):
+    """Folder of files with as many chunks as sizes says, and the vectors of the chunks"""
+    docs = [doc for file_id, size in sizes.items() for doc in docs_of(file_id, size)]
+    ids = {}
+    doc_ids = FolderIndex._track(ids, docs)
+    vectors = np.random.RandomState(0).rand(len(docs), 8).astype(np.float32)
+    index = FAISS(
+        None,
+        build_index(config, vectors),
+        InMemoryDocstore(dict(zip(doc_ids, docs))),
+        dict(enumerate(doc_ids)),
+    )
+    files = [File(name=file_id, id=file_id) for file_id in sizes]
+    return FolderIndex(files, index, ids=ids, index_config=config), vectors
+
+
+@pytest.mark.parametrize("config", CONFIGS, ids=lambda config: config.kind)
+def test_removed_files_are_not_returned(config):
+    folder, vectors = folder_index(config, {"a": 3, "b": 20, "c": 20})
+    kept = set(folder.ids["b"]) | set(folder.ids["c"])
+
+    folder.remove_files(["a"])
+
+    for j in range(3, len(vectors)):
+        results = folder._dense_search(vectors[j:j + 1], 5)
+        assert len(results) == 5
+        assert set(results) <= kept
+    assert len(folder.index.index_to_docstore_id) == 40
+
+
+def test_hnsw_keeps_removed_vectors_until_the_threshold():
+    config = CONFIGS[2]
+    folder, _ = folder_index(config, {"a": 3, "b": 20, "c": 20})
+
+    folder.remove_files(["a"])
+    assert folder.index.index.ntotal == 43
+
+    folder.remove_files(["b"])
+    # rebuilt from the vectors left, small enough for a flat index
+    assert folder.index.index.ntotal == 20
+    assert folder.index_config.kind == "flat"
+    assert sorted(folder.index.index_to_docstore_id) == list(range(20))
+
+
+@pytest.mark.parametrize("config", CONFIGS, ids=lambda config: config.kind)
+def test_documents_added_after_removals_are_found(config):
+    folder, _ = folder_index(config, {"a": 3, "b": 20})
+    folder.remove_files(["a"])
+    docs = docs_of("d", 2)
+    vectors = np.full((2, 8), 5.0, dtype=np.float32)
+    vectors[1] *= 2
+
+    folder._add_to_index(docs, vectors.tolist())
+
+    assert folder._dense_search(vectors[1:], 1) == list(folder.ids["d"])[1:]
+    assert len(set(folder.index.index_to_docstore_id.values())) == 22
@@ -0,0 +1,42 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("langchain")
+pytest.importorskip("faiss")
+
+from Main.core.index_registry import IndexRegistry  # noqa: E402
+
+
+def folder_index():
+    file = SimpleNamespace(docs=[SimpleNamespace(page_content="some text")])
+    return SimpleNamespace(index=None, files=[file], mapped=False, index_config=None)
+
+
+def test_handles_finalized_while_the_lock_is_held_do_not_deadlock():
+    registry = IndexRegistry(max_bytes=0)
+    handle = registry.register("a", folder_index(), [])
+
+    def collect_inside_register():
+        # what the garbage collector does when it runs during an allocation in register
+        with registry._lock:
+            handle.release()
+
+    thread = threading.Thread(target=collect_inside_register)
+    thread.start()
+    thread.join(timeout=5)
+
+    assert not thread.is_alive()
+    assert registry.stats()["handles"] == 0
+
+
+def test_released_entries_are_evicted_over_budget():
+    registry = IndexRegistry(max_bytes=0)
+    handle = registry.register("a", folder_index(), [])
+    registry.get("a").release()
+
+    assert registry.stats()["entries"] == 1
+    handle.release()
+    assert registry.stats()["entries"] == 0
+    assert registry.evictions == 1
@@ -0,0 +1,99 @@
+import time
+
+from Main.core import PDF_Parser
+from Main.core.ocr import OCRImage, run_ocr
+
+
+def image(name: str, page: int = 0) -> OCRImage:
+    return OCRImage(page=page, name=name, data=name.encode("utf-8"))
+
+
+def test_texts_come_back_in_input_order(ocr_stub):
+    ocr_stub.behaviors = {"a.jpg": {"polls": 2}, "b.jpg": {"polls": 0}}
+
+    texts = run_ocr([image("a.jpg"), image("b.jpg")], initial_delay=0.01, max_delay=0.05)
+
+    assert texts == ["text of a.jpg", "text of b.jpg"]
+
+
+def test_repeated_images_are_submitted_once(ocr_stub):
+    texts = run_ocr(
+        [image("logo.jpg", 0), image("logo.jpg", 1), image("chart.jpg", 1)],
+        initial_delay=0.01,
+    )
+
+    assert texts == ["text of logo.jpg", "text of logo.jpg", "text of chart.jpg"]
+    assert sorted(ocr_stub.submits) == ["chart.jpg", "logo.jpg"]
+
+
+def test_cached_images_are_not_submitted_again(ocr_stub):
+    run_ocr([image("a.jpg")], initial_delay=0.01)
+    texts = run_ocr([image("a.jpg")], initial_delay=0.01)
+
+    assert texts == ["text of a.jpg"]
+    assert ocr_stub.submits == ["a.jpg"]
+
+
+def test_images_are_submitted_concurrently(ocr_stub):
+    ocr_stub.delay = 0.2
+    images = [image(f"{i}.jpg") for i in range(8)]
+
+    started = time.monotonic()
+    texts = run_ocr(images, max_workers=4, initial_delay=0.01)
+    elapsed = time.monotonic() - started
+
+    assert texts == [f"text of {i}.jpg" for i in range(8)]
+    assert ocr_stub.max_in_flight == 4
+    # two rounds of four submits, not eight sequential ones
+    assert elapsed < 8 * 0.2
+
+
+def test_polling_backs_off_while_nothing_completes(ocr_stub):
+    ocr_stub.behaviors = {"slow.jpg": {"polls": 4}}
+
+    texts = run_ocr([image("slow.jpg")], initial_delay=0.05, max_delay=0.2)
+
+    assert texts == ["text of slow.jpg"]
+    times = ocr_stub.poll_times("slow.jpg")
+    gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+    # 0.1, 0.2, then capped at max_delay
+    assert gaps[0] >= 0.09
+    assert gaps[1] >= 0.19
+    assert all(gap < 0.2 + 0.1 for gap in gaps[2:])
+
+
+def test_images_not_done_before_the_timeout_are_none(ocr_stub):
+    ocr_stub.behaviors = {"never.jpg": {"polls": 10 ** 6}}
+
+    started = time.monotonic()
+    texts = run_ocr(
+        [image("never.jpg"), image("fast.jpg")], timeout=0.5, initial_delay=0.05, max_delay=0.1
+    )
+
+    assert texts == [None, "text of fast.jpg"]
+    assert time.monotonic() - started < 1.5
+
+
+def test_failed_submits_are_none(ocr_stub):
+    ocr_stub.behaviors = {"broken.jpg": {"fail": True}}
+
+    texts = run_ocr([image("broken.jpg"), image("fine.jpg")], initial_delay=0.01)
+
+    assert texts == [None, "text of fine.jpg"]
+
+
+def test_hung_submits_time_out(ocr_stub, monkeypatch):
+    monkeypatch.setattr(PDF_Parser, "OCR_REQUEST_TIMEOUT", 0.3)
+    ocr_stub.behaviors = {"hung.jpg": {"hang": 5}}
+
+    started = time.monotonic()
+    texts = run_ocr([image("hung.jpg"), image("fine.jpg")], initial_delay=0.01)
+
+    assert texts == [None, "text of fine.jpg"]
+    assert time.monotonic() - started < 2
+
+
+def test_unreachable_service_returns_none(ocr_stub, monkeypatch):
+    monkeypatch.setattr(PDF_Parser, "OCR_API_URL", "http://127.0.0.1:9/")
+
+    assert run_ocr([image("a.jpg")], initial_delay=0.01) == [None]
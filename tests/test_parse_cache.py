@@ -0,0 +1,36 @@
+import os
+
+from Main.core.parse_cache import ParseCache
+
+
+def entry_size(cache: ParseCache, key: str) -> int:
+    return os.path.getsize(cache._path(key))
+
+
+def test_the_directory_is_only_scanned_when_the_cap_is_crossed(tmp_path, monkeypatch):
+    cache = ParseCache(str(tmp_path), 1024 ** 2)
+    scans = []
+    entries = cache._entries
+    monkeypatch.setattr(cache, "_entries", lambda: scans.append(1) or entries())
+
+    for i in range(20):
+        cache.put(f"key{i}", {"text": "x" * 100})
+    cache.put("key0", {"text": "x" * 200})
+
+    assert len(scans) == 1
+    assert cache._size == cache.stats()["bytes"]
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ParseCache(str(tmp_path), 1024 ** 2)
+    for i in range(3):
+        cache.put(f"key{i}", {"text": "x" * 100})
+        os.utime(cache._path(f"key{i}"), (i, i))
+    cache.get("key0")
+    cache.max_bytes = entry_size(cache, "key0") + entry_size(cache, "key2")
+
+    cache.put("key2", {"text": "x" * 100})
+
+    assert cache.get("key1") is None
+    assert cache.get("key0") == {"text": "x" * 100}
+    assert cache._size == cache.stats()["bytes"] <= cache.max_bytes
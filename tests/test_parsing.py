@@ -0,0 +1,47 @@
+from io import BytesIO
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("langchain")
+
+from Main.core.parsing import PPTFile, reading_order  # noqa: E402
+
+
+def shape(name, top, left):
+    return SimpleNamespace(name=name, top=top, left=left)
+
+
+def test_shapes_are_read_top_to_bottom_then_left_to_right():
+    shapes = [
+        shape("right column", 200, 500),
+        shape("placeholder", None, None),
+        shape("left column", 200, 0),
+        shape("title", 0, 0),
+    ]
+
+    assert [s.name for s in reading_order(shapes)] == [
+        "title", "left column", "right column", "placeholder"
+    ]
+
+
+def test_slides_are_read_in_reading_order_not_z_order():
+    pptx = pytest.importorskip("pptx")
+    from pptx.util import Inches
+
+    prs = pptx.Presentation()
+    slide = prs.slides.add_slide(prs.slide_layouts[6])
+    # added, and so stacked, in reverse reading order
+    for text, left, top in [("right", 5, 2), ("left", 0, 2), ("heading", 0, 0)]:
+        box = slide.shapes.add_textbox(Inches(left), Inches(top), Inches(4), Inches(1))
+        box.text_frame.text = text
+    group = slide.shapes.add_group_shape()
+    for text, top in [("second", 5), ("first", 4)]:
+        box = group.shapes.add_textbox(Inches(0), Inches(top), Inches(4), Inches(1))
+        box.text_frame.text = text
+    data = BytesIO()
+    prs.save(data)
+
+    file = PPTFile.from_bytes(data)
+
+    assert file.docs[0].page_content == "heading\nleft\nright\nfirst\nsecond"